@@ -0,0 +1,90 @@
+"""
+Compare the vectorized contour grouping with the previous pairwise loop.
+
+Run from the repository root:
+
+    python -m benchmarks.grouping
+"""
+
+import time
+
+import numpy as np
+
+from src.utils.detection import contours_overlap, group_contours
+
+
+def legacy_group_contours(all_contours):
+    """
+    The pairwise grouping loop that group_contours replaced.
+    """
+    all_contours = list(all_contours)
+    grouped_contours = []
+    i = 0
+    while i < len(all_contours):
+        current_contour, current_score = all_contours[i]
+        max_contour, max_score = current_contour, current_score
+
+        j = i + 1
+        while j < len(all_contours):
+            other_contour, other_score = all_contours[j]
+            if contours_overlap(current_contour, other_contour):
+                if other_score > max_score:
+                    max_contour, max_score = other_contour, other_score
+                all_contours.pop(j)
+            else:
+                j += 1
+
+        grouped_contours.append(max_contour)
+        i += 1
+
+    return grouped_contours
+
+
+def random_detections(count, canvas_size, rng):
+    """
+    Generate rectangular contours with scores, roughly a third of them overlap
+    a neighbour like duplicate masks of a dense scene do.
+    """
+    detections = []
+    for _ in range(count):
+        x, y = rng.integers(0, canvas_size, 2)
+        w, h = rng.integers(5, 40, 2)
+        contour = np.array(
+            [[[x, y]], [[x, y + h]], [[x + w, y + h]], [[x + w, y]]], dtype=np.int32
+        )
+        detections.append((contour, float(rng.random())))
+    return detections
+
+
+def measure(function, detections, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(detections)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    rng = np.random.default_rng(0)
+    print(f"{'detections':>10} {'legacy':>10} {'vectorized':>10} {'speedup':>8}")
+    for count in (100, 1000, 10000):
+        # Keep the density constant so the amount of grouping is comparable
+        canvas_size = int(np.sqrt(count) * 60)
+        detections = random_detections(count, canvas_size, rng)
+        repeat = 5 if count < 10000 else 1
+
+        legacy_time, legacy_result = measure(legacy_group_contours, detections, repeat)
+        new_time, new_result = measure(group_contours, detections, repeat)
+
+        assert len(legacy_result) == len(new_result)
+        assert all(a is b for a, b in zip(legacy_result, new_result))
+        print(
+            f"{count:>10} {legacy_time:>9.4f}s {new_time:>9.4f}s "
+            f"{legacy_time / new_time:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Compare zooming with 50k selected polygon vertices when every handle is
+resized on each wheel step with handles that ignore the view transformation.
+
+Run from the repository root:
+
+    python -m benchmarks.handle_scaling
+"""
+
+import random
+import time
+
+from PySide6.QtCore import QPoint, QPointF, Qt
+from PySide6.QtGui import QWheelEvent
+from PySide6.QtWidgets import QApplication
+
+from src.widgets.image_view import ImageView
+from src.widgets.labels.label_layer import LabelLayer
+
+IMAGE_SIZE = 20000
+POLYGONS = 500
+VERTICES_PER_POLYGON = 100
+WHEEL_STEPS = 20
+
+
+def synthetic_polygons(rng):
+    labels = []
+    for i in range(POLYGONS):
+        x, y = rng.uniform(0, IMAGE_SIZE - 500), rng.uniform(0, IMAGE_SIZE - 500)
+        labels.append(
+            {
+                "type": "PolygonItem",
+                "polygon": [
+                    [x + rng.uniform(0, 500), y + rng.uniform(0, 500)]
+                    for _ in range(VERTICES_PER_POLYGON)
+                ],
+                "label_name": f"tree {i}",
+                "label_name_id": 0,
+            }
+        )
+    return labels
+
+
+def legacy_handle_size(image_width, image_height, scale_factor):
+    """
+    calculate_handle_size with the bounds PolygonItem used.
+    """
+    handle_size = 0.01 * (image_width + image_height) / 2 * scale_factor
+    return max(2, min(handle_size, 5))
+
+
+def legacy_update_handle_scales(view, scale_factor):
+    """
+    The per-handle resize that ran on every wheel step before handles ignored
+    the view transformation.
+    """
+    for item in view.selected_labels:
+        handle_size = legacy_handle_size(
+            view.image_width, view.image_height, scale_factor
+        )
+        for handle in item.resize_handles:
+            handle.setRect(-handle_size / 2, -handle_size / 2, handle_size, handle_size)
+
+
+def wheel_event(view, zoom_in):
+    position = QPointF(view.viewport().rect().center())
+    return QWheelEvent(
+        position,
+        QPointF(view.viewport().mapToGlobal(position.toPoint())),
+        QPoint(0, 0),
+        QPoint(0, 120 if zoom_in else -120),
+        Qt.NoButton,
+        Qt.NoModifier,
+        Qt.NoScrollPhase,
+        False,
+    )
+
+
+def main():
+    app = QApplication.instance() or QApplication([])
+    rng = random.Random(0)
+
+    view = ImageView()
+    view.image_width = view.image_height = IMAGE_SIZE
+    view.label_layer = LabelLayer(view)
+    view.scene().addItem(view.label_layer)
+    view.load_labels(synthetic_polygons(rng))
+    view.set_selection(set(view.current_labels))
+    handles = sum(len(item.resize_handles) for item in view.selected_labels)
+    print(f"{len(view.selected_labels)} selected polygons, {handles} handles")
+
+    start = time.perf_counter()
+    for step in range(WHEEL_STEPS):
+        view.wheelEvent(wheel_event(view, step % 2 == 0))
+        legacy_update_handle_scales(view, view.current_scale)
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for step in range(WHEEL_STEPS):
+        view.wheelEvent(wheel_event(view, step % 2 == 0))
+    new_time = time.perf_counter() - start
+
+    print(f"resizing every handle: {legacy_time / WHEEL_STEPS * 1000:.2f}ms per step")
+    print(f"untransformed handles: {new_time / WHEEL_STEPS * 1000:.2f}ms per step")
+
+    view.clear_selection()
+    view.detection_queue.stop_worker()
+    for worker in view.detection_queue.workers:
+        worker.wait()
+    del view
+    del app
+
+
+if __name__ == "__main__":
+    main()
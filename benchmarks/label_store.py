@@ -0,0 +1,102 @@
+"""
+Compare the memory use and load time of labels kept as lists of dicts with
+LabelStore on a synthetic project with 1M labels.
+
+Run from the repository root:
+
+    python -m benchmarks.label_store
+"""
+
+import gc
+import json
+import random
+import time
+import tracemalloc
+
+from src.models.label_image import LabelImage
+
+IMAGES = 1000
+LABELS_PER_IMAGE = 1000
+POLYGON_VERTICES = 12
+
+
+def synthetic_labels(rng):
+    labels = []
+    for i in range(LABELS_PER_IMAGE):
+        x, y = rng.uniform(0, 4000), rng.uniform(0, 3000)
+        if i % 2:
+            labels.append(
+                {
+                    "type": "RectangleItem",
+                    "start_point": [x, y],
+                    "end_point": [x + rng.uniform(5, 200), y + rng.uniform(5, 200)],
+                    "label_name": f"car {i}",
+                    "label_name_id": i % 5,
+                }
+            )
+        else:
+            labels.append(
+                {
+                    "type": "PolygonItem",
+                    "polygon": [
+                        [x + rng.uniform(0, 200), y + rng.uniform(0, 200)]
+                        for _ in range(POLYGON_VERTICES)
+                    ],
+                    "label_name": f"tree {i}",
+                    "label_name_id": i % 5,
+                }
+            )
+    return labels
+
+
+def measure(build):
+    """
+    Time build, then run it again with tracemalloc to measure the memory held
+    by its result. Tracing slows building down, so it isn't timed.
+    """
+    gc.collect()
+    start = time.perf_counter()
+    build()
+    elapsed = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, elapsed, memory
+
+
+def main():
+    rng = random.Random(0)
+    images = [
+        json.dumps({"image_id": i, "labels": synthetic_labels(rng)})
+        for i in range(IMAGES)
+    ]
+    print(f"{IMAGES * LABELS_PER_IMAGE} labels, {IMAGES} images")
+
+    dicts, dicts_time, dicts_memory = measure(
+        lambda: [json.loads(image)["labels"] for image in images]
+    )
+    print(f"dicts: {dicts_time:.2f}s, {dicts_memory / 1024 ** 2:.0f} MB")
+    del dicts
+
+    def build_stores():
+        label_images = []
+        for image in images:
+            label_image = LabelImage(0, "image.png", None, 4000, 3000)
+            label_image.labels = json.loads(image)["labels"]
+            label_images.append(label_image)
+        return label_images
+
+    stores, stores_time, stores_memory = measure(build_stores)
+    print(f"LabelStore: {stores_time:.2f}s, {stores_memory / 1024 ** 2:.0f} MB")
+
+    start = time.perf_counter()
+    for label_image in stores:
+        label_image.labels
+    print(f"LabelStore back to dicts: {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
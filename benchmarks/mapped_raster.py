@@ -0,0 +1,76 @@
+"""
+Open a large .npy image through the memory-mapped backend and time the first
+overview, a full resolution view and a detection region, with the resident
+set size afterwards.
+
+The image is a sparse file, so it takes no disk space and is created
+instantly. Run from the repository root:
+
+    python -m benchmarks.mapped_raster
+"""
+
+import os
+import resource
+import tempfile
+import time
+
+import numpy as np
+from PySide6.QtWidgets import QApplication
+
+from src.models.image_loader import decode_image
+
+IMAGE_WIDTH = 60000
+IMAGE_HEIGHT = 40000
+VIEW_TILES = 4
+
+
+def main():
+    app = QApplication.instance() or QApplication([])
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "orthomosaic.npy")
+        pixels = np.lib.format.open_memmap(
+            path, mode="w+", dtype=np.uint8, shape=(IMAGE_HEIGHT, IMAGE_WIDTH, 3)
+        )
+        del pixels
+        print(f"{IMAGE_WIDTH}x{IMAGE_HEIGHT} RGB, {os.path.getsize(path) / 1e9:.1f} GB")
+
+        start = time.perf_counter()
+        image = decode_image(path)
+        print(f"open: {(time.perf_counter() - start) * 1000:.1f}ms, {image}")
+
+        start = time.perf_counter()
+        level = image.level_for_scale(1920 / IMAGE_WIDTH)
+        columns, rows = image.tile_grid(level)
+        for row in range(rows):
+            for col in range(columns):
+                image.tile_pixmap(level, col, row)
+        print(
+            f"overview, level {level} with {columns * rows} tiles: "
+            f"{(time.perf_counter() - start) * 1000:.1f}ms"
+        )
+
+        start = time.perf_counter()
+        for row in range(VIEW_TILES):
+            for col in range(VIEW_TILES):
+                image.tile_pixmap(0, 40 + col, 30 + row)
+        print(
+            f"full resolution, {VIEW_TILES * VIEW_TILES} tiles: "
+            f"{(time.perf_counter() - start) * 1000:.1f}ms"
+        )
+
+        start = time.perf_counter()
+        image.read_region((30000, 20000, 31024, 21024))
+        print(
+            f"1024x1024 detection region: {(time.perf_counter() - start) * 1000:.1f}ms"
+        )
+
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f"max resident set: {max_rss:.0f}MB")
+        del image
+
+    del app
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Compare painting polygons with thousands of vertices at full detail with the
+simplified polygons LabelLayer draws, at several zoom levels.
+
+Run from the repository root:
+
+    python -m benchmarks.polygon_lod
+"""
+
+import math
+import random
+import time
+
+from PySide6.QtGui import QImage, QPainter, QTransform
+from PySide6.QtWidgets import QApplication, QStyleOptionGraphicsItem
+
+from src.widgets.image_view import ImageView
+from src.widgets.labels.label_layer import LabelLayer
+
+IMAGE_SIZE = 20000
+POLYGONS = 300
+VERTICES_PER_POLYGON = 3000
+SCALES = [1.0, 0.25, 0.05]
+REPEATS = 3
+
+
+def mask_outline(rng, center_x, center_y, radius):
+    """
+    Wobbly outline with a vertex every pixel, like a contour traced from a
+    detection mask.
+    """
+    points = []
+    offset = 0
+    for i in range(VERTICES_PER_POLYGON):
+        offset = max(-radius / 4, min(radius / 4, offset + rng.uniform(-1, 1)))
+        angle = 2 * math.pi * i / VERTICES_PER_POLYGON
+        points.append(
+            [
+                round(center_x + (radius + offset) * math.cos(angle)),
+                round(center_y + (radius + offset) * math.sin(angle)),
+            ]
+        )
+    return points
+
+
+def synthetic_polygons(rng):
+    labels = []
+    for i in range(POLYGONS):
+        labels.append(
+            {
+                "type": "PolygonItem",
+                "polygon": mask_outline(
+                    rng,
+                    rng.uniform(500, IMAGE_SIZE - 500),
+                    rng.uniform(500, IMAGE_SIZE - 500),
+                    VERTICES_PER_POLYGON / (2 * math.pi),
+                ),
+                "label_name": f"object {i}",
+                "label_name_id": 0,
+            }
+        )
+    return labels
+
+
+def paint(layer, scale, full_detail):
+    """
+    Paint the whole layer into an image the size of the scaled image.
+    """
+    size = max(1, int(IMAGE_SIZE * scale))
+    image = QImage(size, size, QImage.Format_ARGB32_Premultiplied)
+    image.fill(0)
+    painter = QPainter(image)
+    painter.setTransform(QTransform.fromScale(scale, scale))
+    option = QStyleOptionGraphicsItem()
+    option.exposedRect = layer.boundingRect()
+    if full_detail:
+        painter.setPen(layer.pen)
+        painter.setBrush(layer.brush)
+        for label in layer.view.current_labels:
+            painter.drawPolygon(label.polygon())
+    else:
+        layer.paint(painter, option)
+    painter.end()
+
+
+def time_paint(layer, scale, full_detail):
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        paint(layer, scale, full_detail)
+    return (time.perf_counter() - start) / REPEATS
+
+
+def main():
+    app = QApplication.instance() or QApplication([])
+    rng = random.Random(0)
+
+    view = ImageView()
+    view.image_width = view.image_height = IMAGE_SIZE
+    layer = LabelLayer(view)
+    view.label_layer = layer
+    view.scene().addItem(layer)
+    view.load_labels(synthetic_polygons(rng))
+    print(f"{POLYGONS} polygons with {VERTICES_PER_POLYGON} vertices")
+
+    for scale in SCALES:
+        start = time.perf_counter()
+        paint(layer, scale, False)
+        first_time = time.perf_counter() - start
+        full_time = time_paint(layer, scale, True)
+        lod_time = time_paint(layer, scale, False)
+        print(
+            f"zoom {scale:>5}: full detail {full_time * 1000:8.1f}ms, "
+            f"simplified {lod_time * 1000:8.1f}ms "
+            f"(first paint {first_time * 1000:.1f}ms)"
+        )
+
+    view.detection_queue.stop_worker()
+    for worker in view.detection_queue.workers:
+        worker.wait()
+    del view
+    del app
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Compare hit-testing, rubber band selection and viewport culling through the
+label grid of ImageView with a scan over every label.
+
+Run from the repository root:
+
+    python -m benchmarks.spatial_index
+"""
+
+import random
+import time
+
+from PySide6.QtCore import QPointF, QRectF, Qt
+from PySide6.QtGui import QImage, QPainter, QPolygonF
+from PySide6.QtWidgets import QApplication, QStyleOptionGraphicsItem
+
+from src.widgets.image_view import ImageView
+from src.widgets.labels.label_layer import LabelLayer
+from src.widgets.labels.rectangle_item import RectangleItem
+
+IMAGE_SIZE = 20000
+LABEL_COUNTS = [10_000, 50_000, 100_000]
+POINTS = 200
+RUBBER_BANDS = 20
+# Size of the visible part of the image when culling, in pixels
+VIEWPORT_SIZE = 2000
+
+
+def synthetic_labels(count, rng):
+    labels = []
+    for i in range(count):
+        x, y = rng.uniform(0, IMAGE_SIZE - 200), rng.uniform(0, IMAGE_SIZE - 200)
+        if i % 2:
+            labels.append(
+                {
+                    "type": "RectangleItem",
+                    "start_point": [x, y],
+                    "end_point": [x + rng.uniform(5, 200), y + rng.uniform(5, 200)],
+                    "label_name": f"car {i}",
+                    "label_name_id": 0,
+                }
+            )
+        else:
+            labels.append(
+                {
+                    "type": "PolygonItem",
+                    "polygon": [
+                        [x + rng.uniform(0, 200), y + rng.uniform(0, 200)]
+                        for _ in range(8)
+                    ],
+                    "label_name": f"tree {i}",
+                    "label_name_id": 1,
+                }
+            )
+    return labels
+
+
+def legacy_label_at(view, point):
+    """
+    The scan over all labels that ImageView.label_at replaced.
+    """
+    for item in reversed(view.current_labels):
+        if isinstance(item, RectangleItem):
+            if item.rect().contains(point):
+                return item
+        elif item.polygon().containsPoint(point, Qt.OddEvenFill):
+            return item
+    return None
+
+
+def legacy_labels_in_rect(view, rect):
+    rect_polygon = QPolygonF(rect)
+    labels = []
+    for item in view.current_labels:
+        if isinstance(item, RectangleItem):
+            if item.rect().intersects(rect):
+                labels.append(item)
+        elif item.polygon().boundingRect().intersects(rect) and rect_polygon.intersects(
+            item.polygon()
+        ):
+            labels.append(item)
+    return labels
+
+
+def legacy_visible_labels(view, exposed):
+    return [
+        label
+        for label in view.current_labels
+        if LabelLayer.label_polygon(label).boundingRect().intersects(exposed)
+    ]
+
+
+def visible_labels(view, exposed):
+    return view.label_index.intersecting(
+        (exposed.left(), exposed.top(), exposed.right(), exposed.bottom())
+    )
+
+
+def measure(function, arguments):
+    start = time.perf_counter()
+    results = [function(*argument) for argument in arguments]
+    return time.perf_counter() - start, results
+
+
+def main():
+    app = QApplication.instance() or QApplication([])
+    views = []
+    rng = random.Random(0)
+
+    for count in LABEL_COUNTS:
+        view = ImageView()
+        views.append(view)
+        view.image_width = view.image_height = IMAGE_SIZE
+        view.label_layer = LabelLayer(view)
+        labels = synthetic_labels(count, rng)
+
+        start = time.perf_counter()
+        view.load_labels(labels)
+        load_time = time.perf_counter() - start
+        print(f"{count} labels, loaded in {load_time:.2f}s")
+
+        points = [
+            (view, QPointF(rng.uniform(0, IMAGE_SIZE), rng.uniform(0, IMAGE_SIZE)))
+            for _ in range(POINTS)
+        ]
+        legacy_time, legacy_hits = measure(legacy_label_at, points)
+        grid_time, grid_hits = measure(ImageView.label_at, points)
+        assert legacy_hits == grid_hits
+        print(
+            f"  click:       scan {legacy_time / POINTS * 1000:.3f}ms, "
+            f"grid {grid_time / POINTS * 1000:.3f}ms"
+        )
+
+        rubber_bands = [
+            (
+                view,
+                QRectF(
+                    rng.uniform(0, IMAGE_SIZE - 1000),
+                    rng.uniform(0, IMAGE_SIZE - 1000),
+                    rng.uniform(50, 1000),
+                    rng.uniform(50, 1000),
+                ),
+            )
+            for _ in range(RUBBER_BANDS)
+        ]
+        legacy_time, legacy_selections = measure(legacy_labels_in_rect, rubber_bands)
+        grid_time, grid_selections = measure(ImageView.labels_in_rect, rubber_bands)
+        assert [set(labels) for labels in legacy_selections] == [
+            set(labels) for labels in grid_selections
+        ]
+        print(
+            f"  rubber band: scan {legacy_time / RUBBER_BANDS * 1000:.3f}ms, "
+            f"grid {grid_time / RUBBER_BANDS * 1000:.3f}ms"
+        )
+
+        viewports = [
+            (
+                view,
+                QRectF(
+                    rng.uniform(0, IMAGE_SIZE - VIEWPORT_SIZE),
+                    rng.uniform(0, IMAGE_SIZE - VIEWPORT_SIZE),
+                    VIEWPORT_SIZE,
+                    VIEWPORT_SIZE,
+                ),
+            )
+            for _ in range(RUBBER_BANDS)
+        ]
+        legacy_time, legacy_visible = measure(legacy_visible_labels, viewports)
+        grid_time, grid_visible = measure(visible_labels, viewports)
+        assert [set(labels) for labels in legacy_visible] == grid_visible
+        print(
+            f"  culling:     scan {legacy_time / RUBBER_BANDS * 1000:.3f}ms, "
+            f"grid {grid_time / RUBBER_BANDS * 1000:.3f}ms"
+        )
+
+        image = QImage(VIEWPORT_SIZE, VIEWPORT_SIZE, QImage.Format_ARGB32)
+        option = QStyleOptionGraphicsItem()
+        start = time.perf_counter()
+        for _, exposed in viewports:
+            image.fill(0)
+            painter = QPainter(image)
+            painter.translate(-exposed.topLeft())
+            option.exposedRect = exposed
+            view.label_layer.paint(painter, option)
+            painter.end()
+        paint_time = time.perf_counter() - start
+        print(f"  layer paint: {paint_time / RUBBER_BANDS * 1000:.3f}ms per viewport")
+
+    for view in views:
+        view.detection_queue.stop_worker()
+        for worker in view.detection_queue.workers:
+            worker.wait()
+    del views
+    del app
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import cv2
+
+from src.models.anno_project import AnnoProject
+from src.utils.constants import (
+    DETECTION_CONFIG,
+    DETECTION_WEIGHTS,
+    DETECTION_DEVICE,
+    DETECTION_ALL_PARTS,
+)
+from src.utils.detection import (
+    contour_to_polygon,
+    detect_contours,
+    init_detection_process,
+)
+
+
+def detect_image(path, confidence_threshold):
+    """
+    Run the detection pipeline on a whole image inside a worker process.
+
+    :param path: Path to the image.
+    :param confidence_threshold: Minimum score of a prediction.
+    :return: List of polygons as lists of [x, y] points.
+    """
+    image = cv2.imread(path, cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError(f"Unable to load the image {path}")
+
+    contours = detect_contours(
+        image, confidence_threshold, all_parts=DETECTION_ALL_PARTS
+    )
+    if contours and isinstance(contours[0], str):
+        raise FileNotFoundError(f"Model not found: {DETECTION_WEIGHTS}")
+
+    return [
+        [[float(x), float(y)] for x, y in contour_to_polygon(contour)]
+        for contour in contours
+    ]
+
+
+def polygon_labels(label_image, polygons, label_name, label_name_id):
+    """
+    Build PolygonItem dicts for the detected polygons with names that don't
+    collide with the labels already in the image.
+    """
+    existing_names = set(label_image.get_label_store().names)
+    labels = []
+    i = 0
+    for polygon in polygons:
+        while f"{label_name} {i}" in existing_names:
+            i += 1
+        name = f"{label_name} {i}"
+        existing_names.add(name)
+        labels.append(
+            {
+                "type": "PolygonItem",
+                "polygon": polygon,
+                "label_name": name,
+                "label_name_id": label_name_id,
+            }
+        )
+    return labels
+
+
+class ProgressJournal:
+    """
+    Append-only record of annotated images, kept next to the project file.
+
+    Every line holds the full label list of one finished image, so replaying
+    the journal after a crash restores everything that wasn't saved yet. The
+    journal is removed once a run has annotated and saved every image.
+    """
+
+    def __init__(self, project_path):
+        self.path = project_path + ".autoanno"
+
+    def replay(self, anno_project):
+        """
+        Apply finished images to the project.
+
+        :return: Set of finished image ids.
+        """
+        done = set()
+        if not os.path.exists(self.path):
+            return done
+
+        images = {image.image_id: image for image in anno_project.images}
+        with open(self.path, "r") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Last line of a crashed run may be incomplete
+                    continue
+                image = images.get(record["image_id"])
+                if image is not None:
+                    anno_project.set_labels(image, record["labels"])
+                    done.add(record["image_id"])
+        return done
+
+    def append(self, label_image):
+        with open(self.path, "a") as file:
+            record = {"image_id": label_image.image_id, "labels": label_image.labels}
+            file.write(json.dumps(record) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def auto_annotate(
+    project_path,
+    label_name=None,
+    confidence_threshold=0.1,
+    workers=None,
+    save_every=50,
+    skip_labelled=False,
+    restart=False,
+):
+    anno_project = AnnoProject.load(project_path, None)
+
+    if label_name is None:
+        if not anno_project.class_names:
+            raise ValueError("The project has no label names, pass --label")
+        label_name = anno_project.class_names[0]
+    if label_name not in anno_project.class_names:
+        anno_project.class_names.append(label_name)
+    label_name_id = anno_project.class_names.index(label_name)
+
+    journal = ProgressJournal(project_path)
+    if restart:
+        journal.remove()
+    done = journal.replay(anno_project)
+
+    pending = [
+        image
+        for image in anno_project.images
+        if image.image_id not in done and not (skip_labelled and image.label_count)
+    ]
+    total = len(pending)
+    print(f"{len(done)} images already done, {total} to annotate")
+    if not pending:
+        anno_project.save_project()
+        journal.remove()
+        return
+
+    workers = workers or max(1, (os.cpu_count() or 1) // 4)
+    threads_per_worker = max(1, (os.cpu_count() or 1) // workers)
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=init_detection_process,
+        initargs=(
+            DETECTION_CONFIG,
+            DETECTION_WEIGHTS,
+            DETECTION_DEVICE,
+            threads_per_worker,
+        ),
+    )
+
+    start = time.perf_counter()
+    finished = 0
+    failed = 0
+    unsaved = 0
+    queue = iter(pending)
+    running = {}
+    try:
+        # Keep a bounded number of images in flight instead of submitting all
+        while True:
+            while len(running) < workers * 2:
+                image = next(queue, None)
+                if image is None:
+                    break
+                future = executor.submit(detect_image, image.path, confidence_threshold)
+                running[future] = image
+            if not running:
+                break
+
+            completed, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in completed:
+                image = running.pop(future)
+                try:
+                    polygons = future.result()
+                except (FileNotFoundError, BrokenProcessPool):
+                    raise
+                except Exception as e:
+                    print(f"Skipping {image.path}: {e}", file=sys.stderr)
+                    failed += 1
+                    continue
+
+                anno_project.set_labels(
+                    image,
+                    image.labels
+                    + polygon_labels(image, polygons, label_name, label_name_id),
+                )
+                journal.append(image)
+                finished += 1
+                unsaved += 1
+
+                elapsed = time.perf_counter() - start
+                print(
+                    f"[{finished}/{total}] {image.name}: {len(polygons)} objects "
+                    f"({finished / elapsed:.2f} images/s)"
+                )
+
+            if unsaved >= save_every:
+                anno_project.save_project()
+                unsaved = 0
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        anno_project.save_project()
+
+    # The saved project holds every journaled image now. A stale journal
+    # would overwrite later edits on the next run, keep it only to retry
+    # the images that failed.
+    if failed:
+        print(f"{failed} images failed, run again to retry them", file=sys.stderr)
+    else:
+        journal.remove()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Annotate every image of an AnnoImage project with the "
+        "detection model, without the GUI."
+    )
+    parser.add_argument("project", help="Path to the .annoimg project")
+    parser.add_argument(
+        "--label",
+        help="Label name given to detected objects, defaults to the first "
+        "label name of the project",
+    )
+    parser.add_argument(
+        "--threshold", type=float, default=0.1, help="Confidence threshold"
+    )
+    parser.add_argument(
+        "--workers", type=int, help="Number of detection processes"
+    )
+    parser.add_argument(
+        "--save-every",
+        type=int,
+        default=50,
+        help="Save the project after this many annotated images",
+    )
+    parser.add_argument(
+        "--skip-labelled",
+        action="store_true",
+        help="Skip images that already have labels",
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="Ignore the progress of previous runs",
+    )
+    args = parser.parse_args()
+
+    if not (os.path.exists(args.project) and args.project.endswith(".annoimg")):
+        parser.error(f"{args.project} is not an .annoimg project")
+
+    try:
+        auto_annotate(
+            args.project,
+            label_name=args.label,
+            confidence_threshold=args.threshold,
+            workers=args.workers,
+            save_every=args.save_every,
+            skip_labelled=args.skip_labelled,
+            restart=args.restart,
+        )
+    except KeyboardInterrupt:
+        print("Interrupted, run again to resume", file=sys.stderr)
+        sys.exit(1)
+    except (FileNotFoundError, ValueError, BrokenProcessPool) as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -69,7 +69,7 @@ class MyApp(QMainWindow):
                             self.save_settings()
                     self.show_welcome_widget()
             else:
-                anno_project = AnnoProject.load(path, self)
+                anno_project = AnnoProject.load(path, self, lazy=True)
                 self.show_app_gui(anno_project)
 
     def show_welcome_widget(self):
@@ -147,6 +147,7 @@ class MyApp(QMainWindow):
 
     def closeEvent(self, event):
         if self.app_gui:
+            self.app_gui.apply_pending_update()
             if not self.app_gui.anno_project.is_saved():
                 yes_or_no_dialog = YesOrNoDialog(
                     title="Unsaved changes",
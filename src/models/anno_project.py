@@ -1,12 +1,19 @@
-import json
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from PIL import Image
 from PySide6.QtWidgets import QFileDialog
 
+from src.models.coco_writer import write_coco
+from src.models.export_manifest import ExportManifest
+from src.models.label_export import coco_annotations, yolo_lines
 from src.models.label_image import LabelImage
-from src.widgets.labels.polygon_item import PolygonItem
-from src.widgets.labels.rectangle_item import RectangleItem
+from src.models.project_file import ProjectFile
+from src.utils.constants import EXPORT_WORKERS
+from src.utils.functions import read_image_sizes
+
+
+class ExportCancelled(Exception):
+    pass
 
 
 class AnnoProject:
@@ -18,6 +25,7 @@ class AnnoProject:
         class_names: list,
         last_opened: str,
         path=None,
+        project_file=None,
     ):
         self.main_window = main_window
         self.path = path
@@ -28,13 +36,24 @@ class AnnoProject:
         self.images = images
         self.saved = True
         self.current_image = None
-        self.last_saved_state = None
-        self.save_project()
+        # Ids of images changed since the last save, so checking for unsaved
+        # changes doesn't have to serialize the project
+        self.dirty_images = set()
+        self.saved_class_names = None
+        self.project_file = project_file
+        if project_file is None:
+            self.save_project()
+        else:
+            self.saved_class_names = list(self.class_names)
 
-    def save_project(self):
+    def save_project(self, compact=False):
         """
         Save the project to a file.
         This function saves the project to a file with the extension ".annoimg".
+        Only the images changed since the last save are written, unless the
+        journal needs to be merged into the file.
+
+        :param compact: Always write the whole project.
         """
 
         if not (self.path and self.path.endswith(".annoimg")):
@@ -44,36 +63,135 @@ class AnnoProject:
             if not self.path:
                 return
 
-        json_data = self.to_dict()
-        with open(self.path, "w") as file:
-            json.dump(json_data, file)
+        if self.project_file is None or self.project_file.path != self.path:
+            self.project_file = ProjectFile(self.path)
+            compact = True
+
+        if compact or self.project_file.needs_compaction():
+            entries = self.project_file.write_snapshot(
+                self.header_dict(), self.snapshot_images()
+            )
+            # Labels that were never loaded are read from the new file
+            for image, entry in zip(self.images, entries):
+                if not image.labels_loaded:
+                    offset, length = entry[5:]
+                    image.unload_labels(self.project_file.label_loader(offset, length))
+        else:
+            images = self.images_by_id()
+            self.project_file.append(
+                self.header_dict(),
+                [images[image_id].to_dict() for image_id in self.dirty_images],
+            )
+
+        self.dirty_images.clear()
+        self.saved_class_names = list(self.class_names)
+
+    def iter_label_stores(self):
+        """
+        Yield (image, label store) pairs of all images, without keeping labels
+        that weren't loaded before in memory.
+        """
+        for image in self.images:
+            label_loader = image.label_loader
+            yield image, image.get_label_store()
+            if label_loader is not None:
+                image.unload_labels(label_loader)
 
-        self.last_saved_state = json_data
+    def snapshot_images(self):
+        """
+        Yield the dicts of all images, without keeping labels that weren't
+        loaded before in memory.
+        """
+        for image in self.images:
+            label_loader = image.label_loader
+            yield image.to_dict()
+            if label_loader is not None:
+                image.unload_labels(label_loader)
 
     @classmethod
-    def load(cls, path, main_window):
-        with open(path, "r") as file:
-            json_data = json.load(file)
-            name = json_data.get("name")
-            class_names = json_data.get("class_names")
-            last_opened = json_data.get("last_opened")
-            images = [
-                LabelImage.from_dict(image_data)
-                for image_data in json_data.get("images")
-            ]
-            return cls(main_window, name, images, class_names, last_opened, path)
+    def load(cls, path, main_window, lazy=False):
+        """
+        Load a project from a file.
+
+        :param lazy: Read only the image index, labels of an image are read
+            when they are first needed. Falls back to reading everything for
+            project files without an index.
+        """
+        project_file = ProjectFile(path)
+        if lazy:
+            lazy_data = project_file.read_lazy()
+            if lazy_data is not None:
+                header, entries, changed_images = lazy_data
+                changed_images = {image["image_id"]: image for image in changed_images}
+                images = []
+                for entry in entries:
+                    image_id, image_path, width, height, label_count = entry[:5]
+                    if image_id in changed_images:
+                        label_image = LabelImage.from_dict(changed_images[image_id])
+                    else:
+                        label_image = LabelImage(
+                            image_id,
+                            image_path,
+                            None,
+                            width,
+                            height,
+                            label_loader=project_file.label_loader(*entry[5:]),
+                            label_count=label_count,
+                        )
+                    images.append(label_image)
+                return cls(
+                    main_window,
+                    header.get("name"),
+                    images,
+                    header.get("class_names"),
+                    header.get("last_opened"),
+                    path,
+                    project_file,
+                )
+
+        json_data = project_file.read()
+        name = json_data.get("name")
+        class_names = json_data.get("class_names")
+        last_opened = json_data.get("last_opened")
+        images = [
+            LabelImage.from_dict(image_data) for image_data in json_data.get("images")
+        ]
+        return cls(
+            main_window, name, images, class_names, last_opened, path, project_file
+        )
 
     @classmethod
-    def create(cls, main_window, name, images, class_names, last_opened):
+    def create(
+        cls,
+        main_window,
+        name,
+        images,
+        class_names,
+        last_opened,
+        lazy=False,
+        progress_callback=None,
+    ):
+        """
+        Create a new project from a list of image paths.
+
+        :param lazy: Don't read image sizes now, they are filled in when an
+            image is opened or the project is exported.
+        :param progress_callback: Called with (done, total) while image sizes
+            are read.
+        """
+        if lazy:
+            sizes = [(None, None)] * len(images)
+        else:
+            sizes = read_image_sizes(images, progress_callback=progress_callback)
+
         label_images = []
-        for i, image_path in enumerate(images):
-            image = Image.open(image_path)
+        for i, (image_path, (width, height)) in enumerate(zip(images, sizes)):
             label_image = LabelImage(
                 image_id=i,
                 labels=[],
                 path=image_path,
-                width=image.width,
-                height=image.height,
+                width=width,
+                height=height,
             )
             label_images.append(label_image)
 
@@ -86,16 +204,32 @@ class AnnoProject:
             path=None,
         )
 
-    def to_dict(self):
+    def header_dict(self):
         return {
             "name": self.name,
             "class_names": self.class_names,
             "last_opened": self.last_opened,
+        }
+
+    def to_dict(self):
+        return {
+            **self.header_dict(),
             "images": [image.to_dict() for image in self.images],
         }
 
+    def images_by_id(self):
+        return {image.image_id: image for image in self.images}
+
     def export_project(
-        self, dataset_type, ignore_polygons, save_empty_files, save_path
+        self,
+        dataset_type,
+        ignore_polygons,
+        save_empty_files,
+        save_path,
+        progress_callback=None,
+        is_cancelled=None,
+        compact=False,
+        tolerance=None,
     ):
         """
         Export the project with the given settings.
@@ -103,71 +237,159 @@ class AnnoProject:
         :param dataset_type: The type of dataset to export ('COCO' or 'YOLO').
         :param ignore_polygons: Whether to ignore polygons or convert them to rectangles.
         :param save_path: The directory path where the exported data will be saved.
+        :param progress_callback: Called with (done, total) number of images.
+        :param is_cancelled: Function returning True when the export should stop.
+        :param compact: Write COCO files without indentation.
+        :param tolerance: Simplify COCO polygons to this tolerance in pixels.
+        :raises ValueError: When the size of an image can't be read.
         """
+        unreadable = self.fill_image_sizes()
+        if unreadable:
+            names = ", ".join(image.name for image in unreadable[:10])
+            if len(unreadable) > 10:
+                names += f" and {len(unreadable) - 10} more"
+            raise ValueError(f"Unable to read the size of the images {names}")
+
         if dataset_type == "COCO":
-            self.export_to_coco(save_path)
+            self.export_to_coco(
+                save_path, compact, progress_callback, is_cancelled, tolerance
+            )
         elif dataset_type == "YOLO":
-            self.export_to_yolo(save_path, ignore_polygons, save_empty_files)
-
-    def export_to_coco(self, save_path):
-        coco_data = {
-            "images": [],
-            "annotations": [],
-            "categories": [
-                {"id": i, "name": name} for i, name in enumerate(self.class_names)
-            ],
-        }
+            self.export_to_yolo(
+                save_path,
+                ignore_polygons,
+                save_empty_files,
+                progress_callback,
+                is_cancelled,
+            )
+
+    def export_to_coco(
+        self,
+        save_path,
+        compact=False,
+        progress_callback=None,
+        is_cancelled=None,
+        tolerance=None,
+    ):
+        """
+        Write annotations.json, one image and annotation at a time.
 
-        annotation_id = 1
-        for img in self.images:
-            coco_image = {
+        :param compact: Write the file without indentation, with the faster
+            orjson encoder when it is installed.
+        :param tolerance: Simplify polygon segmentations, see coco_annotations.
+        """
+        images = (
+            {
                 "id": img.image_id,
                 "file_name": img.name,
                 "height": img.height,
                 "width": img.width,
             }
-            coco_data["images"].append(coco_image)
+            for img in self.images
+        )
+        categories = [
+            {"id": i, "name": name} for i, name in enumerate(self.class_names)
+        ]
 
-            for label_dict in img.labels:
-                label = (
-                    RectangleItem.from_dict(label_dict, self.main_window)
-                    if label_dict["type"] == "RectangleItem"
-                    else PolygonItem.from_dict(label_dict, self.main_window)
+        def annotations():
+            annotation_id = 1
+            for done, (img, label_store) in enumerate(self.iter_label_stores(), 1):
+                if is_cancelled is not None and is_cancelled():
+                    raise ExportCancelled()
+                image_annotations = coco_annotations(
+                    label_store, img.image_id, annotation_id, tolerance
                 )
-                coco_annotation = label.to_coco_annotation()
-                coco_annotation["image_id"] = img.image_id
-                coco_annotation["id"] = annotation_id
-                coco_data["annotations"].append(coco_annotation)
-
-                annotation_id += 1
-
-        with open(os.path.join(save_path, "annotations.json"), "w") as file:
-            json.dump(coco_data, file, indent=4)
-
-    def export_to_yolo(self, save_path, ignore_polygons, save_empty_files):
-        for img in self.images:
-            yolo_labels = []
-            for label_dict in img.labels:
-                label = (
-                    RectangleItem.from_dict(label_dict, self.main_window)
-                    if label_dict["type"] == "RectangleItem"
-                    else PolygonItem.from_dict(label_dict, self.main_window)
+                yield from image_annotations
+                annotation_id += len(image_annotations)
+                if progress_callback is not None:
+                    progress_callback(done, len(self.images))
+
+        path = os.path.join(save_path, "annotations.json")
+        temp_path = path + ".tmp"
+        try:
+            with open(temp_path, "w") as file:
+                write_coco(
+                    file,
+                    [
+                        ("images", images),
+                        ("annotations", annotations()),
+                        ("categories", categories),
+                    ],
+                    compact=compact,
+                    fast=compact,
                 )
-                if ignore_polygons and isinstance(label, PolygonItem):
-                    continue
-                elif isinstance(label, PolygonItem):
-                    label = label.to_rectangle_item()
+        except ExportCancelled:
+            os.remove(temp_path)
+            return
+        os.replace(temp_path, path)
 
-                yolo_label = label.to_yolo_label(img.width, img.height)
-                yolo_labels.append(yolo_label)
+    def export_to_yolo(
+        self,
+        save_path,
+        ignore_polygons,
+        save_empty_files,
+        progress_callback=None,
+        is_cancelled=None,
+        max_workers=EXPORT_WORKERS,
+    ):
+        """
+        Write one YOLO label file per image, several files at a time. Files
+        whose content didn't change since the last export into save_path are
+        not written again.
+        """
+        manifest = ExportManifest(save_path)
 
+        def export_image(img):
+            label_loader = img.label_loader
+            yolo_labels = yolo_lines(
+                img.get_label_store(), img.width, img.height, ignore_polygons
+            )
+            # Don't keep labels that weren't loaded before, like
+            # iter_label_stores
+            if label_loader is not None:
+                img.unload_labels(label_loader)
             if not yolo_labels and not save_empty_files:
-                continue
+                return
+
+            file_name = f"{os.path.splitext(img.name)[0]}.txt"
+            content = "\n".join(yolo_labels)
+            digest = manifest.digest(content)
+            if manifest.is_unchanged(file_name, digest):
+                return
+
+            with open(os.path.join(save_path, file_name), "w") as file:
+                file.write(content)
+            manifest.update(file_name, digest)
+
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            futures = [executor.submit(export_image, img) for img in self.images]
+            for done, future in enumerate(as_completed(futures), start=1):
+                future.result()
+                if progress_callback is not None:
+                    progress_callback(done, len(futures))
+                if is_cancelled is not None and is_cancelled():
+                    break
+        finally:
+            executor.shutdown(cancel_futures=True)
+            manifest.save()
 
-            with open(
-                os.path.join(save_path, f"{os.path.splitext(img.name)[0]}.txt"), "w"
-            ) as file:
-                file.write("\n".join(yolo_labels))
+    def fill_image_sizes(self):
+        """
+        Read the sizes of images that were added without them.
+
+        :return: List of the images whose size couldn't be read.
+        """
+        missing = [image for image in self.images if image.width is None]
+        sizes = read_image_sizes([image.path for image in missing])
+        unreadable = []
+        for image, (width, height) in zip(missing, sizes):
+            if width is None:
+                unreadable.append(image)
+                continue
+            image.width, image.height = width, height
+            self.mark_dirty(image)
+        return unreadable
 
     def get_current_image(self):
         for image in self.images:
@@ -178,6 +400,15 @@ class AnnoProject:
     def set_current_image(self, label_image):
         self.current_image = label_image
 
+    def set_labels(self, label_image, labels):
+        """
+        Replace the labels of an image and mark it as changed.
+        """
+        label_image.labels = labels
+        self.mark_dirty(label_image)
+
+    def mark_dirty(self, label_image):
+        self.dirty_images.add(label_image.image_id)
+
     def is_saved(self):
-        current_state = self.to_dict()
-        return self.last_saved_state == current_state
+        return not self.dirty_images and self.class_names == self.saved_class_names
@@ -0,0 +1,51 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Indentation of the items of a section, json.dump(..., indent=4) puts them
+# two levels deep
+ITEM_INDENT = "\n        "
+
+
+def encode_item(item, compact, fast):
+    if not compact:
+        return json.dumps(item, indent=4).replace("\n", ITEM_INDENT)
+    if fast and orjson is not None:
+        return orjson.dumps(item).decode()
+    return json.dumps(item, separators=(",", ":"))
+
+
+def write_coco(file, sections, compact=False, fast=False):
+    """
+    Write a COCO file one item at a time, so the items never have to be in
+    memory together.
+
+    The default output is the same as json.dump(dict(sections), file, indent=4),
+    compact output has no whitespace.
+
+    :param file: Text file to write to.
+    :param sections: List of (key, iterable of items) tuples.
+    :param compact: Write without indentation.
+    :param fast: Encode compact output with orjson when it is installed.
+    """
+    file.write("{")
+    for i, (key, items) in enumerate(sections):
+        if compact:
+            file.write(("," if i else "") + json.dumps(key) + ":[")
+        else:
+            file.write(("," if i else "") + "\n    " + json.dumps(key) + ": [")
+
+        empty = True
+        for item in items:
+            if compact:
+                file.write(("" if empty else ",") + encode_item(item, True, fast))
+            else:
+                file.write(("" if empty else ",") + ITEM_INDENT)
+                file.write(encode_item(item, False, fast))
+            empty = False
+
+        file.write("]" if compact or empty else "\n    ]")
+    file.write("}" if compact else "\n}")
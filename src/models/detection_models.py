@@ -1,6 +1,28 @@
+import heapq
+import itertools
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 from PySide6.QtCore import QThread, Signal, QObject, QWaitCondition, QMutex
 
-from src.utils.detection import detect_contours
+from src.models.image_loader import read_image_region
+from src.models.model_registry import model_registry
+from src.utils.constants import (
+    DETECTION_CONFIG,
+    DETECTION_WEIGHTS,
+    DETECTION_DEVICE,
+    DETECTION_WORKERS,
+    DETECTION_BATCH_SIZE,
+    DETECTION_USE_PROCESSES,
+)
+from src.utils.detection import (
+    detect_contours_batch,
+    init_detection_process,
+    merge_tile_contours,
+    run_detection_batch,
+)
 
 
 class DetectionTask:
@@ -12,6 +34,10 @@ class DetectionTask:
         label_name,
         params=None,
         confidence_threshold=0.1,
+        priority=0,
+        path=None,
+        crop_rect=None,
+        tile_job=None,
     ):
         self.image = image
         self.original_image_id = original_image_id
@@ -19,30 +45,233 @@ class DetectionTask:
         self.label_name = label_name
         self.params = params
         self.confidence_threshold = confidence_threshold
+        # Lower values are processed first, equal priorities in FIFO order
+        self.priority = priority
+        # When image is None the worker reads crop_rect from the image at path,
+        # so queued tasks don't hold any pixels
+        self.path = path
+        self.crop_rect = crop_rect
+        self.tile_job = tile_job
+        # Filled in by the worker, in seconds
+        self.load_time = 0.0
+        self.inference_time = 0.0
+
+    def get_image(self, image_source=None):
+        """
+        Return the image to run the detection on, in BGR order.
+
+        :param image_source: Function returning the decoded image of a path,
+            or None if it isn't in memory. Other images are read from the file.
+        """
+        if self.image is not None:
+            return self.image
+
+        x, y, width, height = self.crop_rect
+        box = (x, y, x + width, y + height)
+        source = image_source(self.path) if image_source is not None else None
+        if source is None:
+            return read_image_region(self.path, box)
+        return source.read_region(box)
+
+    def release_image(self):
+        """
+        Drop pixels that can be read again from the image.
+        """
+        if self.path is not None:
+            self.image = None
+
+    def is_compatible(self, other):
+        """
+        Check if both tasks can be processed in the same inferencer call.
+        """
+        return (
+            self.confidence_threshold == other.confidence_threshold
+            and self.params == other.params
+        )
+
+
+class TileJob:
+    """
+    Collects the results of the tiles of one large detection region.
+
+    The tile contours are moved into the coordinates of the region and merged
+    across tile seams once every tile has finished.
+    """
+
+    def __init__(self, task, tile_count):
+        self.task = task
+        self.pending = tile_count
+        self.contours = []
+        # Tile of every contour, in the coordinates of the region
+        self.tiles = []
+        self.failed = False
+
+    def add_result(self, tile_task, results):
+        """
+        Store the results of a finished tile.
+
+        :return: True when this was the last tile of the job.
+        """
+        self.pending -= 1
+        if results and isinstance(results[0], str):
+            self.failed = True
+        elif not self.failed:
+            offset = np.array(
+                [
+                    tile_task.image_part_position[0] - self.task.image_part_position[0],
+                    tile_task.image_part_position[1] - self.task.image_part_position[1],
+                ],
+                dtype=np.int32,
+            )
+            self.contours.extend(contour + offset for contour in results)
+            tile = (*offset, *tile_task.crop_rect[2:])
+            self.tiles.extend(tile for _ in results)
+
+        return self.pending == 0
+
+    def results(self):
+        if self.failed:
+            return ["no_model_found"]
+        return merge_tile_contours(self.contours, self.tiles)
+
+
+class TaskQueue:
+    """
+    Priority queue of detection tasks. Not thread safe, guarded by the mutex of
+    DetectionQueue.
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.counter = itertools.count()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def push(self, task):
+        heapq.heappush(self.heap, (task.priority, next(self.counter), task))
+
+    def pop_batch(self, batch_size):
+        """
+        Pop the next task together with up to batch_size - 1 compatible tasks.
+        Incompatible tasks keep their place in the queue.
+        """
+        first = heapq.heappop(self.heap)
+        batch = [first[2]]
+        skipped = []
+        while self.heap and len(batch) < batch_size:
+            entry = heapq.heappop(self.heap)
+            if entry[2].is_compatible(first[2]):
+                batch.append(entry[2])
+            else:
+                skipped.append(entry)
+
+        for entry in skipped:
+            heapq.heappush(self.heap, entry)
+        return batch
 
 
 class DetectionWorker(QThread):
     task_finished = Signal(DetectionTask, list)
 
-    def __init__(self, task_queue, condition, mutex):
+    # How often an idle worker checks whether models can be released, in ms
+    IDLE_CHECK_INTERVAL = 60000
+
+    def __init__(
+        self,
+        task_queue,
+        condition,
+        mutex,
+        replica=0,
+        batch_size=1,
+        executor=None,
+        image_source=None,
+    ):
         super().__init__()
         self.task_queue = task_queue
         self.condition = condition
         self.mutex = mutex
+        self.replica = replica
+        self.batch_size = batch_size
+        self.executor = executor
+        self.image_source = image_source
         self.running = True
+        self.preload_requested = False
 
     def run(self):
         while self.running:
             self.mutex.lock()
             if self.task_queue:
-                task = self.task_queue.pop(0)
+                tasks = self.task_queue.pop_batch(self.batch_size)
+                self.mutex.unlock()
+                try:
+                    results = self.process_tasks(tasks)
+                except Exception as e:
+                    # E.g. an image that was moved or can't be read. Finish
+                    # the tasks anyway so tiled jobs and the queue go on.
+                    print(f"Detection failed: {e}")
+                    for task in tasks:
+                        task.release_image()
+                    results = [[] for _ in tasks]
+                for task, task_results in zip(tasks, results):
+                    self.task_finished.emit(task, task_results)
+            elif self.preload_requested:
+                self.preload_requested = False
                 self.mutex.unlock()
-                results = detect_contours(task.image, task.confidence_threshold)
-                self.task_finished.emit(task, results)
+                if self.executor is None:
+                    model_registry.preload(replica=self.replica)
+                else:
+                    self.executor.submit(
+                        init_detection_process,
+                        DETECTION_CONFIG,
+                        DETECTION_WEIGHTS,
+                        DETECTION_DEVICE,
+                    )
             else:
-                self.condition.wait(self.mutex)
+                if not self.condition.wait(self.mutex, self.IDLE_CHECK_INTERVAL):
+                    model_registry.evict_idle()
                 self.mutex.unlock()
 
+    def process_tasks(self, tasks):
+        """
+        Run detection on a batch of compatible tasks.
+
+        :return: List of results, one per task.
+        """
+        images = [task.get_image(self.image_source) for task in tasks]
+        confidence_threshold = tasks[0].confidence_threshold
+        all_parts = (tasks[0].params or {}).get("all_parts", False)
+
+        if self.executor is not None:
+            future = self.executor.submit(
+                run_detection_batch,
+                images,
+                confidence_threshold,
+                DETECTION_CONFIG,
+                DETECTION_WEIGHTS,
+                DETECTION_DEVICE,
+                all_parts,
+            )
+            results, load_time, inference_time = future.result()
+        else:
+            start = time.perf_counter()
+            try:
+                model = model_registry.get(replica=self.replica)
+            except FileNotFoundError:
+                return [["no_model_found"] for _ in tasks]
+            load_time = time.perf_counter() - start
+
+            results = detect_contours_batch(
+                images, confidence_threshold, model, all_parts
+            )
+            inference_time = model.last_inference_time
+
+        for task in tasks:
+            task.load_time = load_time
+            task.inference_time = inference_time
+            task.release_image()
+        return results
+
     def stop(self):
         self.running = False
         self.condition.wakeAll()
@@ -52,24 +281,105 @@ class DetectionQueue(QObject):
     task_added = Signal()
     task_completed = Signal(DetectionTask, list)
 
-    def __init__(self):
+    def __init__(
+        self,
+        num_workers=DETECTION_WORKERS,
+        batch_size=DETECTION_BATCH_SIZE,
+        use_processes=DETECTION_USE_PROCESSES,
+        preload_model=False,
+        image_source=None,
+    ):
+        """
+        :param image_source: Function returning the decoded image of a path if
+            it is in memory, see DetectionTask.get_image. Called from the
+            worker threads.
+        """
         super().__init__()
-        self.queue = []
+        self.queue = TaskQueue()
         self.condition = QWaitCondition()
         self.mutex = QMutex()
-        self.worker = DetectionWorker(self.queue, self.condition, self.mutex)
-        self.worker.task_finished.connect(self.on_task_finished)
-        self.worker.start()
+
+        self.executor = None
+        if use_processes:
+            self.executor = ProcessPoolExecutor(
+                max_workers=num_workers,
+                # Forking a process that runs a Qt event loop is not safe
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_detection_process,
+                initargs=(DETECTION_CONFIG, DETECTION_WEIGHTS, DETECTION_DEVICE),
+            )
+        else:
+            model_registry.reserve(num_workers)
+
+        self.workers = []
+        for i in range(num_workers):
+            worker = DetectionWorker(
+                self.queue,
+                self.condition,
+                self.mutex,
+                replica=i,
+                batch_size=batch_size,
+                executor=self.executor,
+                image_source=image_source,
+            )
+            worker.task_finished.connect(self.on_task_finished)
+            worker.start()
+            self.workers.append(worker)
+
+        if preload_model:
+            self.preload_model()
 
     def add_task(self, task):
         self.mutex.lock()
-        self.queue.append(task)
+        self.queue.push(task)
         self.mutex.unlock()
         self.task_added.emit()
         self.condition.wakeOne()
 
+    def preload_model(self):
+        """
+        Load the detection models in the background so the first task doesn't
+        have to wait for them.
+        """
+        self.mutex.lock()
+        for worker in self.workers:
+            worker.preload_requested = True
+        self.mutex.unlock()
+        self.condition.wakeAll()
+
+    def add_tiled_task(self, task, tiles):
+        """
+        Split a detection task into one task per tile. The merged result is
+        emitted as the result of the original task.
+
+        :param task: Task describing the whole region and the image path.
+        :param tiles: List of (x, y, width, height) tuples in image coordinates.
+        """
+        tile_job = TileJob(task, len(tiles))
+        for tile in tiles:
+            self.add_task(
+                DetectionTask(
+                    image=None,
+                    original_image_id=task.original_image_id,
+                    image_part_position=(tile[0], tile[1]),
+                    label_name=task.label_name,
+                    params=task.params,
+                    confidence_threshold=task.confidence_threshold,
+                    priority=task.priority,
+                    path=task.path,
+                    crop_rect=tile,
+                    tile_job=tile_job,
+                )
+            )
+
     def on_task_finished(self, task, results):
-        self.task_completed.emit(task, results)
+        if task.tile_job is None:
+            self.task_completed.emit(task, results)
+        elif task.tile_job.add_result(task, results):
+            self.task_completed.emit(task.tile_job.task, task.tile_job.results())
 
     def stop_worker(self):
-        self.worker.stop()
+        for worker in self.workers:
+            worker.stop()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
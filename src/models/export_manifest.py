@@ -0,0 +1,46 @@
+import hashlib
+import json
+import os
+
+
+class ExportManifest:
+    """
+    Content hashes of the files written into an export directory, kept in a
+    hidden file there. Files whose content and hash didn't change since the
+    last export don't have to be written again.
+    """
+
+    FILE_NAME = ".annoimage_export.json"
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, self.FILE_NAME)
+        self.hashes = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as file:
+                    self.hashes = json.load(file)
+            except (OSError, json.JSONDecodeError):
+                self.hashes = {}
+
+    @staticmethod
+    def digest(content):
+        return hashlib.sha1(content.encode()).hexdigest()
+
+    def is_unchanged(self, file_name, digest):
+        """
+        :return: True if the file was written with this content by an earlier
+            export and still exists.
+        """
+        return self.hashes.get(file_name) == digest and os.path.exists(
+            os.path.join(self.directory, file_name)
+        )
+
+    def update(self, file_name, digest):
+        self.hashes[file_name] = digest
+
+    def save(self):
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as file:
+            json.dump(self.hashes, file)
+        os.replace(temp_path, self.path)
@@ -0,0 +1,61 @@
+import time
+
+from PySide6.QtCore import QThread, Signal
+
+# Minimum time between two progress updates, in seconds
+PROGRESS_INTERVAL = 0.1
+
+
+class ExportWorker(QThread):
+    """
+    Runs AnnoProject.export_project outside the GUI thread.
+    """
+
+    progress = Signal(int, int)
+
+    def __init__(
+        self,
+        anno_project,
+        dataset_type,
+        ignore_polygons,
+        save_empty_files,
+        save_path,
+        compact=False,
+        tolerance=None,
+    ):
+        super().__init__()
+        self.anno_project = anno_project
+        self.dataset_type = dataset_type
+        self.ignore_polygons = ignore_polygons
+        self.save_empty_files = save_empty_files
+        self.save_path = save_path
+        self.compact = compact
+        self.tolerance = tolerance
+        self.cancelled = False
+        self.error = None
+        self.last_progress = 0
+
+    def run(self):
+        try:
+            self.anno_project.export_project(
+                self.dataset_type,
+                self.ignore_polygons,
+                self.save_empty_files,
+                self.save_path,
+                progress_callback=self.report_progress,
+                is_cancelled=lambda: self.cancelled,
+                compact=self.compact,
+                tolerance=self.tolerance,
+            )
+        except Exception as e:
+            # Reported by the dialog, a failed export must not look finished
+            self.error = e
+
+    def report_progress(self, done, total):
+        now = time.monotonic()
+        if done == total or now - self.last_progress >= PROGRESS_INTERVAL:
+            self.last_progress = now
+            self.progress.emit(done, total)
+
+    def cancel(self):
+        self.cancelled = True
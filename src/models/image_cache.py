@@ -0,0 +1,121 @@
+import threading
+from collections import OrderedDict
+
+from PySide6.QtCore import QObject, QRunnable, QThreadPool
+
+from src.utils.constants import IMAGE_CACHE_BYTES
+
+
+class ImageCache:
+    """
+    Thread safe LRU cache of decoded images, bounded by their size in bytes.
+
+    Values must have an nbytes attribute. Images larger than the whole cache
+    are not stored.
+    """
+
+    def __init__(self, max_bytes=IMAGE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.images = OrderedDict()
+        self.cached_bytes = 0
+        self.lock = threading.Lock()
+
+    def __contains__(self, path):
+        with self.lock:
+            return path in self.images
+
+    def __len__(self):
+        return len(self.images)
+
+    def get(self, path):
+        with self.lock:
+            image = self.images.get(path)
+            if image is not None:
+                self.images.move_to_end(path)
+            return image
+
+    def put(self, path, image):
+        if image.nbytes > self.max_bytes:
+            return
+
+        with self.lock:
+            previous = self.images.pop(path, None)
+            if previous is not None:
+                self.cached_bytes -= previous.nbytes
+
+            self.images[path] = image
+            self.cached_bytes += image.nbytes
+            while self.cached_bytes > self.max_bytes:
+                _, evicted = self.images.popitem(last=False)
+                self.cached_bytes -= evicted.nbytes
+
+    def clear(self):
+        with self.lock:
+            self.images.clear()
+            self.cached_bytes = 0
+
+
+class PrefetchTask(QRunnable):
+    def __init__(self, prefetcher, path):
+        super().__init__()
+        self.prefetcher = prefetcher
+        self.path = path
+
+    def run(self):
+        self.prefetcher.prefetch_path(self.path)
+
+
+class ImagePrefetcher(QObject):
+    """
+    Decodes images the user is likely to open next into an ImageCache, using a
+    small dedicated thread pool.
+    """
+
+    def __init__(self, cache, decode, max_threads=2):
+        """
+        :param cache: ImageCache the decoded images are stored in.
+        :param decode: Function that decodes an image path, may return None
+            for images that shouldn't be cached.
+        :param max_threads: Number of images decoded at the same time.
+        """
+        super().__init__()
+        self.cache = cache
+        self.decode = decode
+        self.thread_pool = QThreadPool(self)
+        self.thread_pool.setMaxThreadCount(max_threads)
+        self.wanted = set()
+        self.in_flight = set()
+        self.lock = threading.Lock()
+
+    def prefetch(self, paths):
+        """
+        Replace the set of images to prefetch. Queued images that are no longer
+        wanted are skipped when their turn comes.
+
+        :param paths: Image paths, most wanted first.
+        """
+        with self.lock:
+            self.wanted = set(paths)
+            to_start = [
+                path
+                for path in paths
+                if path not in self.in_flight and path not in self.cache
+            ]
+            self.in_flight.update(to_start)
+
+        for priority, path in enumerate(reversed(to_start)):
+            self.thread_pool.start(PrefetchTask(self, path), priority)
+
+    def prefetch_path(self, path):
+        try:
+            with self.lock:
+                wanted = path in self.wanted
+            if wanted and path not in self.cache:
+                image = self.decode(path)
+                if image is not None:
+                    self.cache.put(path, image)
+        except Exception as e:
+            print(f"Unable to prefetch {path}: {e}")
+        finally:
+            with self.lock:
+                self.in_flight.discard(path)
@@ -0,0 +1,56 @@
+import os
+
+from PySide6.QtCore import QAbstractListModel, QModelIndex, Qt
+
+from src.utils.list_widget_delegate import CURRENT_ROLE, SUBTITLE_ROLE
+
+
+class ImageListModel(QAbstractListModel):
+    """
+    List model over the images of a project. Rows are read from the project
+    when the view paints them, so no widget or item is created per image.
+    """
+
+    def __init__(self, anno_project, parent=None):
+        super().__init__(parent)
+        self.anno_project = anno_project
+        self.current_row = None
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.anno_project.images)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        image = self.anno_project.images[index.row()]
+        if role == Qt.DisplayRole:
+            return image.name
+        elif role == SUBTITLE_ROLE:
+            # Directory of the image
+            return os.path.dirname(image.path)
+        elif role == CURRENT_ROLE:
+            # The image open in the image viewer
+            return index.row() == self.current_row
+        return None
+
+    def set_current_row(self, row):
+        """
+        Mark the image open in the image viewer, only the old and the new row
+        are repainted.
+        """
+        previous_row, self.current_row = self.current_row, row
+        for changed_row in (previous_row, row):
+            if changed_row is not None and changed_row < self.rowCount():
+                changed_index = self.index(changed_row)
+                self.dataChanged.emit(changed_index, changed_index, [CURRENT_ROLE])
+
+    def reset(self):
+        """
+        Call after images were added to or removed from the project.
+        """
+        self.beginResetModel()
+        self.current_row = None
+        self.endResetModel()
@@ -1,18 +1,115 @@
+import cv2
+import numpy as np
 from PIL import Image
-from PIL.ImageQt import ImageQt
 from PySide6.QtCore import QThread, Signal
-from PySide6.QtGui import QPixmap
+from PySide6.QtGui import QImage
+
+from src.models.image_pyramid import ImagePyramid, array_region_bgr
+from src.models.image_source import open_mapped_image
+from src.utils.constants import TILED_RENDERING_PIXELS
+
+
+class DecodedImage:
+    """
+    Decoded pixels of an image that is displayed as a single pixmap.
+
+    The QImage used for display and the array regions are read from for
+    detection share one buffer, so the pixels are held in memory only once.
+    """
+
+    def __init__(self, image: Image.Image):
+        mode = "RGBA" if "A" in image.getbands() else "RGBX"
+        self.width, self.height = image.size
+        self.data = image.convert(mode).tobytes()
+        image.close()
+
+        self.qimage = QImage(
+            self.data,
+            self.width,
+            self.height,
+            self.width * 4,
+            QImage.Format_RGBA8888 if mode == "RGBA" else QImage.Format_RGBX8888,
+        )
+        self.pixels = np.frombuffer(self.data, np.uint8).reshape(
+            self.height, self.width, 4
+        )
+
+    @property
+    def nbytes(self):
+        return len(self.data)
+
+    def read_region(self, box):
+        """
+        :return: BGR array of a (left, top, right, bottom) region.
+        """
+        return array_region_bgr(self.pixels, box)
+
+
+def decode_image(path, max_pixels=None):
+    """
+    Decode an image for display. Safe to call from any thread.
+
+    :param max_pixels: Don't decode images with more pixels than this.
+    :return: ImagePyramid for very large images, DecodedImage otherwise, None
+        if the image is larger than max_pixels.
+    """
+    pixels = open_mapped_image(path)
+    if pixels is not None:
+        height, width = pixels.shape[:2]
+        if max_pixels is not None and width * height > max_pixels:
+            return None
+        if width * height > TILED_RENDERING_PIXELS:
+            # Tiles are read from the file while they are painted, so opening
+            # doesn't depend on the size of the image
+            return ImagePyramid.from_mapped(pixels)
+        return DecodedImage(Image.fromarray(pixels[:, :]))
+
+    image = Image.open(path)
+    if max_pixels is not None and image.width * image.height > max_pixels:
+        image.close()
+        return None
+    if image.width * image.height > TILED_RENDERING_PIXELS:
+        # A single pixmap of a huge image takes seconds to upload and
+        # several copies of the pixels, display it tile by tile instead
+        return ImagePyramid.from_pil(image)
+    return DecodedImage(image)
+
+
+def read_image_region(path, box):
+    """
+    Read a region of an image file for detection. Safe to call from any thread.
+
+    Only used for images that are not decoded in memory. Files that can be
+    mapped are read only where the region is, others are decoded and released
+    again right away.
+
+    :param box: (left, top, right, bottom) tuple.
+    :return: BGR array of the region.
+    """
+    pixels = open_mapped_image(path)
+    if pixels is not None:
+        return array_region_bgr(pixels, box)
+
+    with Image.open(path) as image:
+        region = image.crop(box).convert("RGB")
+    return cv2.cvtColor(np.asarray(region), cv2.COLOR_RGB2BGR)
 
 
 class ImageLoader(QThread):
     loaded = Signal(object)
 
-    def __init__(self, file_path):
+    def __init__(self, file_path, cache=None):
         super().__init__()
         self.file_path = file_path
+        self.cache = cache
 
     def run(self):
-        self.image = Image.open(self.file_path)
-        img = ImageQt(self.image)
-        pixmap = QPixmap.fromImage(img)
-        self.loaded.emit(pixmap)
+        try:
+            image = decode_image(self.file_path)
+        except (OSError, ValueError) as e:
+            print(f"Unable to load {self.file_path}: {e}")
+            image = None
+
+        if image is not None and self.cache is not None:
+            self.cache.put(self.file_path, image)
+        self.loaded.emit(image)
@@ -0,0 +1,186 @@
+import math
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+from PySide6.QtGui import QImage, QPixmap
+
+from src.models.image_source import StridedLevel
+from src.utils.constants import PYRAMID_TILE_SIZE, PYRAMID_CACHE_BYTES
+
+
+class ImagePyramid:
+    """
+    In-memory multi-resolution copy of a large image.
+
+    Level 0 holds the full resolution pixels, every next level is half the
+    size of the previous one. Only the tiles that are painted get converted to
+    pixmaps, and those are kept in a cache bounded by cache_bytes.
+    """
+
+    def __init__(
+        self,
+        levels,
+        tile_size=PYRAMID_TILE_SIZE,
+        cache_bytes=PYRAMID_CACHE_BYTES,
+    ):
+        self.levels = levels
+        self.tile_size = tile_size
+        self.cache_bytes = cache_bytes
+        self.height, self.width = levels[0].shape[:2]
+        self.tile_cache = OrderedDict()
+        self.cached_bytes = 0
+
+    def __repr__(self):
+        return f"ImagePyramid({self.width}x{self.height}, {len(self.levels)} levels)"
+
+    @classmethod
+    def from_pil(cls, image, tile_size=PYRAMID_TILE_SIZE):
+        """
+        Build the pyramid from a PIL image. Runs in the loader thread.
+
+        The whole image is decoded, only formats that open_mapped_image
+        supports are read tile by tile.
+
+        :param image: PIL image, closed after it has been copied.
+        """
+        if image.mode == "L":
+            mode = "L"
+        elif "A" in image.getbands():
+            mode = "RGBA"
+        else:
+            mode = "RGB"
+        if image.mode != mode:
+            # Drop the decoded pixels as soon as the converted copy exists, so
+            # at most two copies of the full image are alive at once
+            converted = image.convert(mode)
+            image.close()
+            image = converted
+        level = np.asarray(image)
+        image.close()
+
+        levels = [level]
+        while max(level.shape[:2]) > tile_size:
+            level = cv2.resize(
+                level,
+                (max(1, level.shape[1] // 2), max(1, level.shape[0] // 2)),
+                interpolation=cv2.INTER_AREA,
+            )
+            levels.append(level)
+
+        return cls(levels, tile_size)
+
+    @classmethod
+    def from_mapped(cls, pixels, tile_size=PYRAMID_TILE_SIZE):
+        """
+        Build the pyramid over pixels mapped from a file, see
+        open_mapped_image. Nothing is read until tiles are painted, smaller
+        levels take every n-th pixel of the visible part instead of being
+        resized in advance.
+        """
+        levels = [pixels]
+        height, width = pixels.shape[:2]
+        step = 1
+        while max(height, width) > tile_size:
+            height, width, step = max(1, height // 2), max(1, width // 2), step * 2
+            levels.append(
+                StridedLevel(pixels, step, (height, width) + pixels.shape[2:])
+            )
+
+        return cls(levels, tile_size)
+
+    @property
+    def nbytes(self):
+        return sum(level.nbytes for level in self.levels)
+
+    def read_region(self, box):
+        """
+        Copy a region of the full resolution level for detection.
+
+        :param box: (left, top, right, bottom) tuple.
+        :return: BGR array of the region.
+        """
+        return array_region_bgr(self.levels[0], box)
+
+    def level_for_scale(self, scale):
+        """
+        Pick the smallest level that still has at least one pixel per screen
+        pixel at the given view scale.
+        """
+        if scale <= 0:
+            return len(self.levels) - 1
+        level = int(math.floor(math.log2(1 / scale))) if scale < 1 else 0
+        return max(0, min(level, len(self.levels) - 1))
+
+    def tile_grid(self, level):
+        """
+        :return: Number of tile columns and rows of the level.
+        """
+        height, width = self.levels[level].shape[:2]
+        return (
+            math.ceil(width / self.tile_size),
+            math.ceil(height / self.tile_size),
+        )
+
+    def tile_pixmap(self, level, col, row):
+        """
+        Return the pixmap of a tile, converting it on first use. Must be called
+        from the GUI thread.
+        """
+        key = (level, col, row)
+        cached = self.tile_cache.get(key)
+        if cached is not None:
+            self.tile_cache.move_to_end(key)
+            return cached[0]
+
+        pixels = self.levels[level][
+            row * self.tile_size : (row + 1) * self.tile_size,
+            col * self.tile_size : (col + 1) * self.tile_size,
+        ]
+        pixmap = QPixmap.fromImage(array_to_qimage(pixels))
+
+        self.tile_cache[key] = (pixmap, pixels.nbytes)
+        self.cached_bytes += pixels.nbytes
+        while self.cached_bytes > self.cache_bytes and len(self.tile_cache) > 1:
+            _, (_, evicted_bytes) = self.tile_cache.popitem(last=False)
+            self.cached_bytes -= evicted_bytes
+
+        return pixmap
+
+
+def array_to_qimage(pixels):
+    """
+    Copy an RGB, RGBA or grayscale array into a QImage.
+    """
+    pixels = np.ascontiguousarray(pixels)
+    height, width = pixels.shape[:2]
+    if pixels.ndim == 2:
+        image_format = QImage.Format_Grayscale8
+    elif pixels.shape[2] == 4:
+        image_format = QImage.Format_RGBA8888
+    else:
+        image_format = QImage.Format_RGB888
+
+    image = QImage(pixels.data, width, height, pixels.strides[0], image_format)
+    return image.copy()
+
+
+def array_region_bgr(pixels, box):
+    """
+    Copy a region of an RGB, RGBA or grayscale array into a BGR array, the
+    order detection models take. The region is copied once, by the color
+    conversion.
+
+    :param box: (left, top, right, bottom) tuple, rounded like PIL.Image.crop
+        and clipped to the array.
+    """
+    left, top, right, bottom = (int(round(value)) for value in box)
+    height, width = pixels.shape[:2]
+    region = pixels[max(0, top) : min(height, bottom), max(0, left) : min(width, right)]
+    if region.ndim == 2:
+        conversion = cv2.COLOR_GRAY2BGR
+    elif region.shape[2] == 4:
+        conversion = cv2.COLOR_RGBA2BGR
+    else:
+        conversion = cv2.COLOR_RGB2BGR
+    return cv2.cvtColor(region, conversion)
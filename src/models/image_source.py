@@ -0,0 +1,247 @@
+import mmap
+
+import numpy as np
+from PIL import TiffImagePlugin
+
+# Number of bands of the image modes that can be read straight from the file
+MAPPED_MODES = {"L": 1, "RGB": 3, "RGBA": 4}
+
+
+class MappedTiles:
+    """
+    Pixels of an image file that stores them tile by tile, or strip by strip.
+
+    Behaves like a read-only numpy array of shape (height, width) or
+    (height, width, bands) for two dimensional slicing. Only the tiles a slice
+    touches are read from the file, through one memory map of the whole file.
+    """
+
+    def __init__(self, file_pixels, offsets, tile_width, tile_height, shape):
+        """
+        :param file_pixels: uint8 array mapped over the whole file.
+        :param offsets: Byte offset of every tile in row major order.
+        """
+        self.file_pixels = file_pixels
+        self.offsets = offsets
+        self.tile_width = tile_width
+        self.tile_height = tile_height
+        self.shape = shape
+        self.dtype = np.dtype(np.uint8)
+        self.columns = -(-shape[1] // tile_width)
+
+    @property
+    def nbytes(self):
+        return int(np.prod(self.shape))
+
+    def tile(self, row, col):
+        """
+        :return: Array view of a tile, edge tiles can be larger than the part
+            of the image they cover.
+        """
+        tile_rows = self.tile_height
+        if self.tile_width == self.shape[1]:
+            # The last strip holds only the rows that are left
+            tile_rows = min(tile_rows, self.shape[0] - row * self.tile_height)
+        offset = int(self.offsets[row * self.columns + col])
+        size = tile_rows * self.tile_width * int(np.prod(self.shape[2:]))
+        return self.file_pixels[offset : offset + size].reshape(
+            (tile_rows, self.tile_width) + self.shape[2:]
+        )
+
+    def __getitem__(self, key):
+        rows, cols = key
+        height, width = self.shape[:2]
+        top, bottom, row_step = rows.indices(height)
+        left, right, col_step = cols.indices(width)
+        region = np.empty(
+            (len(range(top, bottom, row_step)), len(range(left, right, col_step)))
+            + self.shape[2:],
+            self.dtype,
+        )
+        if not region.size:
+            return region
+
+        tile_rows = range(top // self.tile_height, (bottom - 1) // self.tile_height + 1)
+        tile_cols = range(left // self.tile_width, (right - 1) // self.tile_width + 1)
+        for row in tile_rows:
+            row_part = self.tile_part(top, bottom, row_step, row, self.tile_height)
+            if row_part is None:
+                continue
+            out_row, row_slice, row_count = row_part
+            for col in tile_cols:
+                col_part = self.tile_part(left, right, col_step, col, self.tile_width)
+                if col_part is None:
+                    continue
+                out_col, col_slice, col_count = col_part
+                pixels = self.tile(row, col)[row_slice, col_slice]
+                region[out_row : out_row + row_count, out_col : out_col + col_count] = (
+                    pixels
+                )
+        return region
+
+    @staticmethod
+    def tile_part(start, stop, step, tile_index, tile_size):
+        """
+        Part of a slice that falls into one tile.
+
+        :return: (first output index, slice inside the tile, count) or None if
+            the slice skips the tile.
+        """
+        tile_start = tile_index * tile_size
+        first = start + -(-max(0, tile_start - start) // step) * step
+        last = min(stop, tile_start + tile_size)
+        if first >= last:
+            return None
+        return (
+            (first - start) // step,
+            slice(first - tile_start, last - tile_start, step),
+            len(range(first, last, step)),
+        )
+
+
+class StridedLevel:
+    """
+    Smaller level of an image pyramid that takes every step-th pixel of the
+    full resolution pixels, read when a slice of the level is requested.
+    """
+
+    def __init__(self, pixels, step, shape):
+        self.pixels = pixels
+        self.step = step
+        self.shape = shape
+        self.dtype = pixels.dtype
+
+    @property
+    def nbytes(self):
+        return int(np.prod(self.shape))
+
+    def __getitem__(self, key):
+        rows, cols = key
+        top, bottom, _ = rows.indices(self.shape[0])
+        left, right, _ = cols.indices(self.shape[1])
+        step = self.step
+        return np.ascontiguousarray(
+            self.pixels[
+                top * step : bottom * step : step, left * step : right * step : step
+            ]
+        )
+
+
+def open_mapped_image(path):
+    """
+    Map the pixels of an image file into memory without reading them.
+
+    Supported are 8 bit grayscale, RGB and RGBA images in uncompressed TIFF
+    files, striped or tiled, and in .npy files.
+
+    :return: Read-only numpy array or MappedTiles of shape (height, width) or
+        (height, width, bands), None if the file can't be mapped.
+    """
+    if path.lower().endswith(".npy"):
+        return open_npy(path)
+    if path.lower().endswith((".tif", ".tiff")):
+        return open_tiff(path)
+    return None
+
+
+def map_file(path):
+    """
+    :return: Read-only uint8 array over the bytes of a file.
+    """
+    with open(path, "rb") as file:
+        file_map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(mmap, "MADV_RANDOM"):
+        # Pixels are read a few rows of a tile at a time, reading ahead would
+        # load whole tiles that are never looked at
+        file_map.madvise(mmap.MADV_RANDOM)
+    return np.frombuffer(file_map, dtype=np.uint8)
+
+
+def open_npy(path):
+    try:
+        with open(path, "rb") as file:
+            if np.lib.format.read_magic(file) == (1, 0):
+                header = np.lib.format.read_array_header_1_0(file)
+            else:
+                header = np.lib.format.read_array_header_2_0(file)
+            shape, fortran_order, dtype = header
+            offset = file.tell()
+    except (OSError, ValueError) as e:
+        print(f"Unable to map {path}: {e}")
+        return None
+
+    if len(shape) == 3 and shape[2] == 1:
+        shape = shape[:2]
+    if (
+        dtype != np.uint8
+        or fortran_order
+        or not (len(shape) == 2 or (len(shape) == 3 and shape[2] in (3, 4)))
+    ):
+        return None
+    size = int(np.prod(shape))
+    file_pixels = map_file(path)
+    if offset + size > len(file_pixels):
+        return None
+    return file_pixels[offset : offset + size].reshape(shape)
+
+
+def open_tiff(path):
+    # Not Image.open, its decompression bomb check rejects huge images even
+    # though their pixels are never decoded here
+    try:
+        image = TiffImagePlugin.TiffImageFile(path)
+    except (OSError, SyntaxError, ValueError):
+        return None
+
+    with image:
+        tags = image.tag_v2
+        mode = image.mode
+        width, height = image.size
+        bands = MAPPED_MODES.get(mode)
+        # The raw mode differs from the mode for pixels that need converting,
+        # e.g. grayscale with white as zero
+        raw_mode = image.tile[0][3][0] if image.tile else None
+        if TiffImagePlugin.TILEOFFSETS in tags:
+            offsets = tags[TiffImagePlugin.TILEOFFSETS]
+            byte_counts = tags.get(TiffImagePlugin.TILEBYTECOUNTS)
+            tile_width = tags.get(TiffImagePlugin.TILEWIDTH)
+            tile_height = tags.get(TiffImagePlugin.TILELENGTH)
+        else:
+            offsets = tags.get(TiffImagePlugin.STRIPOFFSETS)
+            byte_counts = tags.get(TiffImagePlugin.STRIPBYTECOUNTS)
+            tile_width = width
+            tile_height = min(tags.get(TiffImagePlugin.ROWSPERSTRIP, height), height)
+        if (
+            bands is None
+            or raw_mode != mode
+            or tags.get(TiffImagePlugin.COMPRESSION, 1) != 1
+            or tags.get(TiffImagePlugin.PLANAR_CONFIGURATION, 1) != 1
+            or tuple(tags.get(TiffImagePlugin.BITSPERSAMPLE, (8,))) != (8,) * bands
+            or not offsets
+            or not tile_width
+            or not tile_height
+        ):
+            return None
+
+    columns = -(-width // tile_width)
+    rows = -(-height // tile_height)
+    offsets = np.array(offsets, dtype=np.int64)
+    if len(offsets) != columns * rows:
+        return None
+
+    # Bytes every tile takes in the file, the last strip may be shorter
+    tile_bytes = np.full(len(offsets), tile_width * tile_height * bands)
+    if tile_width == width:
+        tile_bytes[-1] = (height - (rows - 1) * tile_height) * width * bands
+    file_pixels = map_file(path)
+    if (offsets + tile_bytes > len(file_pixels)).any() or (
+        byte_counts is not None and (np.array(byte_counts) < tile_bytes).any()
+    ):
+        return None
+
+    shape = (height, width) if bands == 1 else (height, width, bands)
+    if tile_width == width and (offsets[1:] - offsets[:-1] == tile_bytes[:-1]).all():
+        # Strips that follow each other are one array
+        start = offsets[0]
+        return file_pixels[start : start + height * width * bands].reshape(shape)
+    return MappedTiles(file_pixels, offsets, tile_width, tile_height, shape)
@@ -0,0 +1,153 @@
+import numpy as np
+
+from src.models.label_store import NO_CLASS_ID, POLYGON, RECTANGLE
+
+
+def rectangle_geometry(label_store, mask):
+    """
+    Position and size of rectangle labels, computed the way QRectF does for
+    the rectangle between the start and end point.
+
+    :return: x, y, width and height arrays.
+    """
+    boxes = label_store.boxes[mask]
+    x = np.minimum(boxes[:, 0], boxes[:, 2])
+    y = np.minimum(boxes[:, 1], boxes[:, 3])
+    width = np.maximum(boxes[:, 0], boxes[:, 2]) - x
+    height = np.maximum(boxes[:, 1], boxes[:, 3]) - y
+    return x, y, width, height
+
+
+def polygon_geometry(label_store, mask):
+    """
+    Bounding boxes of polygon labels, computed the way
+    QPolygonF.boundingRect does.
+
+    :return: x, y, width and height arrays.
+    """
+    boxes = label_store.boxes[mask]
+    x, y = boxes[:, 0], boxes[:, 1]
+    return x, y, boxes[:, 2] - x, boxes[:, 3] - y
+
+
+def class_id_list(label_store):
+    return [
+        None if class_id == NO_CLASS_ID else class_id
+        for class_id in label_store.class_ids.tolist()
+    ]
+
+
+def coco_annotations(label_store, image_id, first_id, tolerance=None):
+    """
+    Build the COCO annotations of one image.
+
+    :param label_store: LabelStore of the image.
+    :param image_id: COCO id of the image.
+    :param first_id: Id of the first annotation, the next ones count up.
+    :param tolerance: Simplify polygon segmentations, leaving out vertices
+        closer than this many pixels to the simplified outline. The bbox and
+        area stay the ones of the full polygon.
+    :return: List of annotation dicts in label order.
+    """
+    if not len(label_store):
+        return []
+
+    class_ids = class_id_list(label_store)
+    annotations = [None] * len(label_store)
+
+    rectangle_mask = label_store.kinds == RECTANGLE
+    x, y, width, height = rectangle_geometry(label_store, rectangle_mask)
+    right, bottom = x + width, y + height
+    rectangles = zip(
+        np.flatnonzero(rectangle_mask).tolist(),
+        x.tolist(),
+        y.tolist(),
+        width.tolist(),
+        height.tolist(),
+        right.tolist(),
+        bottom.tolist(),
+        (width * height).tolist(),
+    )
+    for i, x, y, w, h, r, b, area in rectangles:
+        annotations[i] = {
+            "segmentation": [[x, y, r, y, r, b, x, b]],
+            "category_id": class_ids[i],
+            "bbox": [x, y, w, h],
+            "area": area,
+        }
+
+    polygon_mask = label_store.kinds == POLYGON
+    x, y, width, height = polygon_geometry(label_store, polygon_mask)
+    offsets = label_store.offsets
+    points = label_store.coords.reshape(-1, 2)
+    if tolerance is not None:
+        kept = label_store.vertex_ranks() >= tolerance
+        points = points[kept]
+        offsets = np.concatenate([[0], np.cumsum(kept)])[offsets]
+    offsets = offsets.tolist()
+    points = points.tolist()
+    polygons = zip(
+        np.flatnonzero(polygon_mask).tolist(),
+        x.tolist(),
+        y.tolist(),
+        width.tolist(),
+        height.tolist(),
+        (width * height).tolist(),
+    )
+    for i, x, y, w, h, area in polygons:
+        annotations[i] = {
+            "segmentation": [points[offsets[i] : offsets[i + 1]]],
+            "bbox": [x, y, w, h],
+            "area": area,
+            "category_id": class_ids[i],
+            "iscrowd": 0,
+        }
+
+    for annotation_id, annotation in enumerate(annotations, start=first_id):
+        annotation["image_id"] = image_id
+        annotation["id"] = annotation_id
+    return annotations
+
+
+def yolo_lines(label_store, image_width, image_height, ignore_polygons):
+    """
+    Build the YOLO label lines of one image.
+
+    :param ignore_polygons: Skip polygons instead of exporting their bounding
+        boxes.
+    :return: List of lines in label order.
+    """
+    if not len(label_store):
+        return []
+
+    rectangle_mask = label_store.kinds == RECTANGLE
+    x, y, width, height = np.empty((4, len(label_store)))
+    rectangles = rectangle_geometry(label_store, rectangle_mask)
+    x[rectangle_mask], y[rectangle_mask] = rectangles[:2]
+    width[rectangle_mask], height[rectangle_mask] = rectangles[2:]
+
+    # Polygons are exported as the rectangle between the top left and bottom
+    # right corner of their bounding box, like PolygonItem.to_rectangle_item
+    polygon_mask = ~rectangle_mask
+    left, top, box_width, box_height = polygon_geometry(label_store, polygon_mask)
+    right, bottom = left + box_width, top + box_height
+    x[polygon_mask], y[polygon_mask] = left, top
+    width[polygon_mask], height[polygon_mask] = right - left, bottom - top
+
+    center_x = (x + width / 2) / image_width
+    center_y = (y + height / 2) / image_height
+    width = width / image_width
+    height = height / image_height
+
+    keep = rectangle_mask if ignore_polygons else np.ones(len(label_store), bool)
+    class_ids = class_id_list(label_store)
+    return [
+        f"{class_ids[i]} {cx:.6f} {cy:.6f} {w:.6f} {h:.6f}"
+        for i, cx, cy, w, h in zip(
+            np.flatnonzero(keep).tolist(),
+            center_x[keep].tolist(),
+            center_y[keep].tolist(),
+            width[keep].tolist(),
+            height[keep].tolist(),
+        )
+    ]
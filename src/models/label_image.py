@@ -1,17 +1,84 @@
 import os
 
+from src.models.label_store import LabelStore
+
 
 class LabelImage:
-    def __init__(self, image_id: int, path: str, labels: list, width: int, height: int):
+    __slots__ = (
+        "path",
+        "name",
+        "label_store",
+        "label_loader",
+        "_label_count",
+        "image_id",
+        "width",
+        "height",
+    )
+
+    def __init__(
+        self,
+        image_id: int,
+        path: str,
+        labels: list,
+        width: int,
+        height: int,
+        label_loader=None,
+        label_count: int = 0,
+    ):
+        """
+        :param labels: List of label dicts, or None when they are read on
+            first access with label_loader.
+        :param label_loader: Function returning the list of label dicts.
+        :param label_count: Number of labels while they aren't loaded.
+        """
         self.path = path
         self.name = os.path.basename(path)
-        self.labels = labels
+        self.label_store = None if labels is None else LabelStore.from_dicts(labels)
+        self.label_loader = label_loader
+        self._label_count = label_count
         self.image_id = image_id
         self.width = width
         self.height = height
 
     def __repr__(self):
-        return f"LabelImage({self.image_id}, {self.path}, {len(self.labels)} labels)"
+        return f"LabelImage({self.image_id}, {self.path}, {self.label_count} labels)"
+
+    @property
+    def labels(self):
+        """
+        Labels as a new list of dicts. Changes to the list are not stored,
+        assign a list to labels instead.
+        """
+        return self.get_label_store().to_dicts()
+
+    @labels.setter
+    def labels(self, labels):
+        self.label_store = LabelStore.from_dicts(labels)
+        self.label_loader = None
+
+    def get_label_store(self):
+        if self.label_store is None:
+            self.label_store = LabelStore.from_dicts(self.label_loader())
+            self.label_loader = None
+        return self.label_store
+
+    @property
+    def labels_loaded(self):
+        return self.label_store is not None
+
+    @property
+    def label_count(self):
+        if self.label_store is None:
+            return self._label_count
+        return len(self.label_store)
+
+    def unload_labels(self, label_loader):
+        """
+        Drop the labels from memory, they are read again with label_loader.
+        """
+        self._label_count = self.label_count
+        self.label_store = None
+        self.label_loader = label_loader
 
     def to_dict(self):
         return {
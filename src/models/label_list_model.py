@@ -0,0 +1,108 @@
+from PySide6.QtCore import QAbstractListModel, QModelIndex, Qt
+
+from src.utils.list_widget_delegate import SUBTITLE_ROLE
+from src.widgets.labels.rectangle_item import RectangleItem
+
+
+class LabelListModel(QAbstractListModel):
+    """
+    List model over the label items of the image viewer.
+
+    set_labels compares the new labels with the shown ones and only inserts,
+    removes or repaints the rows that changed.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.labels = []
+        self.names = []
+        self.rows = {}
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.labels)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        if role == Qt.DisplayRole:
+            return self.names[index.row()]
+        elif role == SUBTITLE_ROLE:
+            if isinstance(self.labels[index.row()], RectangleItem):
+                return "Rectangle"
+            return "Polygon"
+        return None
+
+    def label(self, index):
+        return self.labels[index.row()]
+
+    def row_of(self, label):
+        """
+        :return: Row of a label item, or None if it isn't listed.
+        """
+        return self.rows.get(label)
+
+    def reset_labels(self, labels):
+        """
+        Show a new list of labels, e.g. of another image.
+        """
+        self.beginResetModel()
+        self.labels = list(labels)
+        self.names = [label.label_name for label in self.labels]
+        self.endResetModel()
+        self.update_rows()
+
+    def set_labels(self, labels):
+        """
+        Show the labels after an edit. Labels can be added, removed or renamed
+        but the ones kept must stay in the same order, otherwise the model is
+        reset.
+        """
+        new_labels = set(labels)
+        kept = [label for label in self.labels if label in new_labels]
+        old_labels = self.rows.keys()
+        if kept != [label for label in labels if label in old_labels]:
+            self.reset_labels(labels)
+            return
+
+        for start, end in reversed(self.missing_runs(self.labels, new_labels)):
+            self.beginRemoveRows(QModelIndex(), start, end - 1)
+            del self.labels[start:end]
+            del self.names[start:end]
+            self.endRemoveRows()
+
+        for start, end in self.missing_runs(labels, old_labels):
+            self.beginInsertRows(QModelIndex(), start, end - 1)
+            self.labels[start:start] = labels[start:end]
+            self.names[start:start] = [label.label_name for label in labels[start:end]]
+            self.endInsertRows()
+
+        for row, label in enumerate(self.labels):
+            if self.names[row] != label.label_name:
+                self.names[row] = label.label_name
+                changed_index = self.index(row)
+                self.dataChanged.emit(changed_index, changed_index, [Qt.DisplayRole])
+        self.update_rows()
+
+    def update_rows(self):
+        self.rows = {label: row for row, label in enumerate(self.labels)}
+
+    @staticmethod
+    def missing_runs(labels, others):
+        """
+        :return: (start, end) of each run of labels that are not in others.
+        """
+        runs = []
+        start = None
+        for row, label in enumerate(labels):
+            if label not in others:
+                if start is None:
+                    start = row
+            elif start is not None:
+                runs.append((start, row))
+                start = None
+        if start is not None:
+            runs.append((start, len(labels)))
+        return runs
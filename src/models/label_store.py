@@ -0,0 +1,170 @@
+import numpy as np
+
+from src.utils.simplification import vertex_importance
+
+RECTANGLE = 0
+POLYGON = 1
+
+# Stored in class_ids for labels saved without a label name id
+NO_CLASS_ID = -1
+
+
+class LabelStore:
+    """
+    Labels of one image kept in numpy arrays instead of a list of dicts.
+
+    kinds holds RECTANGLE or POLYGON for every label and class_ids the label
+    name ids. boxes is an N×4 array with the start and end point of
+    rectangles, and the top left and bottom right corner of the bounding box
+    of polygons. Polygon vertices of all labels are kept in one flat x, y
+    buffer, the vertices of label i are coords[offsets[i]:offsets[i + 1]].
+
+    Coordinates are float64 so labels read back through to_dicts are equal to
+    the ones that were stored.
+
+    ranks holds the Douglas-Peucker rank of every vertex once vertex_ranks was
+    called, so polygons can be simplified to any tolerance without running
+    the simplification again.
+    """
+
+    __slots__ = ("kinds", "class_ids", "names", "boxes", "offsets", "coords", "ranks")
+
+    def __init__(self, kinds, class_ids, names, boxes, offsets, coords):
+        self.kinds = kinds
+        self.class_ids = class_ids
+        self.names = names
+        self.boxes = boxes
+        self.offsets = offsets
+        self.coords = coords
+        self.ranks = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def __repr__(self):
+        return f"LabelStore({len(self)} labels, {self.vertex_count} vertices)"
+
+    @classmethod
+    def empty(cls):
+        return cls.from_dicts([])
+
+    @classmethod
+    def from_dicts(cls, labels):
+        """
+        Build the store from label dicts in the format of RectangleItem.to_dict
+        and PolygonItem.to_dict.
+        """
+        kinds = []
+        class_ids = []
+        names = []
+        boxes = []
+        offsets = [0]
+        coords = []
+        for label in labels:
+            if label["type"] == "RectangleItem":
+                kinds.append(RECTANGLE)
+                boxes.append(label["start_point"] + label["end_point"])
+            else:
+                kinds.append(POLYGON)
+                polygon = label["polygon"]
+                if polygon:
+                    xs = [point[0] for point in polygon]
+                    ys = [point[1] for point in polygon]
+                    boxes.append([min(xs), min(ys), max(xs), max(ys)])
+                else:
+                    boxes.append([0.0, 0.0, 0.0, 0.0])
+                for point in polygon:
+                    coords.extend(point)
+            offsets.append(len(coords) // 2)
+            label_name_id = label["label_name_id"]
+            class_ids.append(NO_CLASS_ID if label_name_id is None else label_name_id)
+            names.append(label["label_name"])
+
+        return cls(
+            np.array(kinds, dtype=np.int8),
+            np.array(class_ids, dtype=np.int32),
+            names,
+            np.array(boxes, dtype=np.float64).reshape(-1, 4),
+            np.array(offsets, dtype=np.int64),
+            np.array(coords, dtype=np.float64),
+        )
+
+    def to_dicts(self):
+        """
+        :return: List of label dicts, equal to the ones the store was built from.
+        """
+        kinds = self.kinds.tolist()
+        class_ids = self.class_ids.tolist()
+        boxes = self.boxes.tolist()
+        offsets = self.offsets.tolist()
+        points = self.coords.reshape(-1, 2).tolist()
+
+        labels = []
+        for i, name in enumerate(self.names):
+            class_id = None if class_ids[i] == NO_CLASS_ID else class_ids[i]
+            if kinds[i] == RECTANGLE:
+                labels.append(
+                    {
+                        "type": "RectangleItem",
+                        "start_point": boxes[i][:2],
+                        "end_point": boxes[i][2:],
+                        "label_name": name,
+                        "label_name_id": class_id,
+                    }
+                )
+            else:
+                labels.append(
+                    {
+                        "type": "PolygonItem",
+                        "polygon": points[offsets[i] : offsets[i + 1]],
+                        "label_name": name,
+                        "label_name_id": class_id,
+                    }
+                )
+        return labels
+
+    @property
+    def vertex_count(self):
+        return int(self.offsets[-1])
+
+    @property
+    def nbytes(self):
+        return (
+            self.kinds.nbytes
+            + self.class_ids.nbytes
+            + self.boxes.nbytes
+            + self.offsets.nbytes
+            + self.coords.nbytes
+        )
+
+    def polygon(self, index):
+        """
+        :return: K×2 array with the vertices of a polygon label.
+        """
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return self.coords[start * 2 : end * 2].reshape(-1, 2)
+
+    def vertex_ranks(self):
+        """
+        :return: Array with the rank of every vertex, see vertex_importance.
+        """
+        if self.ranks is None:
+            ranks = np.empty(self.vertex_count)
+            offsets = self.offsets.tolist()
+            for i in np.flatnonzero(self.kinds == POLYGON).tolist():
+                start, end = offsets[i], offsets[i + 1]
+                ranks[start:end] = vertex_importance(self.polygon(i))
+            self.ranks = ranks
+        return self.ranks
+
+    def bounding_boxes(self):
+        """
+        :return: N×4 array of (x_min, y_min, x_max, y_max) of every label.
+        """
+        return np.concatenate(
+            [
+                np.minimum(self.boxes[:, :2], self.boxes[:, 2:]),
+                np.maximum(self.boxes[:, :2], self.boxes[:, 2:]),
+            ],
+            axis=1,
+        )
@@ -0,0 +1,191 @@
+import threading
+import time
+
+from mmdet.apis import DetInferencer
+
+from src.utils.constants import (
+    DETECTION_CONFIG,
+    DETECTION_WEIGHTS,
+    DETECTION_DEVICE,
+    MODEL_IDLE_TIMEOUT,
+    MODEL_MIN_FREE_MEMORY,
+)
+from src.utils.functions import available_memory
+
+
+class LoadedModel:
+    """
+    A warm DetInferencer together with its load and inference timings.
+    """
+
+    def __init__(self, key, inferencer, load_time):
+        self.key = key
+        self.inferencer = inferencer
+        self.load_time = load_time
+        self.last_used = time.monotonic()
+        self.last_inference_time = 0.0
+        self.total_inference_time = 0.0
+        self.inference_count = 0
+        self.lock = threading.Lock()
+
+    def __repr__(self):
+        return (
+            f"LoadedModel({self.key}, load {self.load_time:.2f}s, "
+            f"{self.inference_count} inferences, "
+            f"last {self.last_inference_time:.2f}s)"
+        )
+
+    def __call__(self, images, batch_size=1):
+        """
+        Run the inferencer on one image or a list of images.
+        Inference calls on the same model are serialized, the inferencer is not
+        reentrant.
+
+        :param images: Image or list of images in BGR order.
+        :param batch_size: Number of images passed to the network at once.
+        :return: Raw output of DetInferencer.
+        """
+        with self.lock:
+            start = time.perf_counter()
+            output = self.inferencer(images, batch_size=batch_size, show=False)
+            self.last_inference_time = time.perf_counter() - start
+
+        self.total_inference_time += self.last_inference_time
+        self.inference_count += 1
+        self.last_used = time.monotonic()
+        return output
+
+
+class ModelRegistry:
+    """
+    Keeps detection models loaded for the whole session.
+
+    Every (config, weights, device) combination is built once and reused by all
+    detection tasks. Models that have not been used for idle_timeout seconds
+    are released, but only when free memory drops below min_free_memory or
+    when more than max_models are loaded.
+    """
+
+    def __init__(
+        self,
+        max_models=2,
+        idle_timeout=MODEL_IDLE_TIMEOUT,
+        min_free_memory=MODEL_MIN_FREE_MEMORY,
+    ):
+        self.max_models = max_models
+        self.idle_timeout = idle_timeout
+        self.min_free_memory = min_free_memory
+        self.models = {}
+        self.lock = threading.Lock()
+        self.loading_locks = {}
+
+    def get(
+        self,
+        config=DETECTION_CONFIG,
+        weights=DETECTION_WEIGHTS,
+        device=DETECTION_DEVICE,
+        replica=0,
+    ):
+        """
+        Return a loaded model, building it on first use.
+
+        :param replica: Index of an independent copy of the model. Workers that
+            run inference in parallel threads each use their own replica.
+        :raises FileNotFoundError: When the config or weights can't be found.
+        :return: LoadedModel object.
+        """
+        key = (config, weights, device, replica)
+        with self.lock:
+            model = self.models.get(key)
+            if model is not None:
+                model.last_used = time.monotonic()
+                return model
+            loading_lock = self.loading_locks.setdefault(key, threading.Lock())
+
+        # Loading can take seconds, other keys must not wait for it
+        with loading_lock:
+            with self.lock:
+                model = self.models.get(key)
+            if model is not None:
+                return model
+
+            start = time.perf_counter()
+            inferencer = DetInferencer(config, device=device, weights=weights)
+            model = LoadedModel(key, inferencer, time.perf_counter() - start)
+            print(f"Loaded {config} on {device} in {model.load_time:.2f}s")
+
+            with self.lock:
+                self.models[key] = model
+            self.evict_idle()
+            return model
+
+    def preload(
+        self,
+        config=DETECTION_CONFIG,
+        weights=DETECTION_WEIGHTS,
+        device=DETECTION_DEVICE,
+        replica=0,
+    ):
+        """
+        Load a model ahead of the first detection task.
+
+        :return: True if the model is ready, False if it couldn't be loaded.
+        """
+        try:
+            self.get(config, weights, device, replica)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def evict_idle(self, force=False):
+        """
+        Release models that have been idle for longer than idle_timeout.
+
+        Nothing is released while there is enough free memory and the number of
+        loaded models is within max_models, unless force is set.
+
+        :param force: Release idle models regardless of memory pressure.
+        :return: List of released keys.
+        """
+        free_memory = available_memory()
+        memory_tight = free_memory is not None and free_memory < self.min_free_memory
+
+        with self.lock:
+            too_many = len(self.models) > self.max_models
+            if not (force or memory_tight or too_many):
+                return []
+
+            now = time.monotonic()
+            by_last_use = sorted(self.models.values(), key=lambda m: m.last_used)
+            evicted = []
+            for model in by_last_use:
+                idle = now - model.last_used > self.idle_timeout
+                over_limit = len(self.models) > self.max_models
+                if idle or over_limit:
+                    if model.lock.locked():
+                        continue
+                    del self.models[model.key]
+                    evicted.append(model.key)
+
+        for key in evicted:
+            print(f"Released model {key[0]} on {key[2]}")
+        return evicted
+
+    def reserve(self, count):
+        """
+        Make room for at least count models so parallel workers don't evict
+        each other's replicas.
+        """
+        with self.lock:
+            self.max_models = max(self.max_models, count)
+
+    def release(self, config, weights, device, replica=0):
+        with self.lock:
+            self.models.pop((config, weights, device, replica), None)
+
+    def clear(self):
+        with self.lock:
+            self.models.clear()
+
+
+model_registry = ModelRegistry()
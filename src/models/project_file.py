@@ -0,0 +1,217 @@
+import json
+import os
+
+from src.utils.constants import JOURNAL_COMPACT_RATIO, JOURNAL_MIN_COMPACT_BYTES
+
+# Snapshots keep the project header on the first line and one image per line
+# after it, so single images can be read without parsing the whole file
+IMAGES_START = b', "images": [\n'
+IMAGES_END = b"]}\n"
+
+
+class ProjectFile:
+    """
+    Storage of an .annoimg project.
+
+    The project file is a JSON snapshot of the whole project. Saves in between
+    only append the changed images to a journal next to it, one JSON record
+    per save. When the journal grows too big it is merged back by writing a
+    new snapshot.
+
+    Snapshots are written to a temporary file and moved over the project file,
+    so a crash leaves either the old or the new snapshot. Every snapshot gets
+    a new generation number and journal records of older generations are
+    ignored, so a journal left behind by a crash is never applied twice.
+    An incomplete record at the end of the journal is skipped on load.
+
+    Next to the snapshot an index file lists the position of every image in
+    it, which lets projects be opened without reading the labels.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.index_path = path + ".idx"
+        self.generation = 0
+        # Whether the snapshot has a matching index and can be read lazily
+        self.indexed = False
+
+    def read(self):
+        """
+        Read the snapshot and apply the journal on top of it.
+
+        :return: Project dict in the format of AnnoProject.to_dict.
+        """
+        with open(self.path, "r") as file:
+            json_data = json.load(file)
+        self.generation = json_data.pop("generation", 0)
+        self.indexed = self.read_index_generation() == self.generation
+
+        images = {image["image_id"]: image for image in json_data["images"]}
+        for record in self.read_journal():
+            json_data.update(self.record_header(record))
+            for image in record["images"]:
+                images[image["image_id"]] = image
+        json_data["images"] = list(images.values())
+
+        return json_data
+
+    def read_lazy(self):
+        """
+        Read the project header and the image index, without any labels.
+
+        :return: Tuple of the header dict, list of index entries
+            (image_id, path, width, height, label_count, offset, length) and
+            list of image dicts changed in the journal, or None if the
+            snapshot has no usable index.
+        """
+        with open(self.path, "rb") as file:
+            first_line = file.readline()
+        if not first_line.endswith(IMAGES_START):
+            return None
+        header = json.loads(first_line[: -len(IMAGES_START)] + b"}")
+        self.generation = header.pop("generation", 0)
+
+        if self.read_index_generation() != self.generation:
+            return None
+        with open(self.index_path, "r") as file:
+            file.readline()
+            entries = [json.loads(line) for line in file]
+        self.indexed = True
+
+        changed_images = {}
+        for record in self.read_journal():
+            header.update(self.record_header(record))
+            for image in record["images"]:
+                changed_images[image["image_id"]] = image
+
+        return header, entries, list(changed_images.values())
+
+    def label_loader(self, offset, length):
+        """
+        :return: Function reading the labels of one image of the snapshot.
+        """
+        return lambda: self.read_image(offset, length)["labels"]
+
+    def read_image(self, offset, length):
+        """
+        Read one image dict of the snapshot.
+        """
+        with open(self.path, "rb") as file:
+            file.seek(offset)
+            return json.loads(file.read(length))
+
+    def read_index_generation(self):
+        if not os.path.exists(self.index_path):
+            return None
+        with open(self.index_path, "r") as file:
+            try:
+                return json.loads(file.readline()).get("generation")
+            except json.JSONDecodeError:
+                return None
+
+    def read_journal(self):
+        """
+        Yield the journal records that belong to the current snapshot.
+        """
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, "r") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get("generation") == self.generation:
+                    yield record
+
+    @staticmethod
+    def record_header(record):
+        return {key: record[key] for key in ("name", "class_names", "last_opened")}
+
+    def write_snapshot(self, header, images):
+        """
+        Replace the project file with a snapshot and drop the journal.
+
+        :param header: Dict with the name, class_names and last_opened of the
+            project.
+        :param images: Iterable of image dicts.
+        :return: List of index entries of the written images.
+        """
+        self.generation += 1
+        entries = []
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "wb") as file:
+            file.write(
+                json.dumps({**header, "generation": self.generation}).encode()[:-1]
+                + IMAGES_START
+            )
+            for i, image in enumerate(images):
+                if i:
+                    file.write(b",\n")
+                data = json.dumps(image).encode()
+                entries.append(
+                    [
+                        image["image_id"],
+                        image["path"],
+                        image["width"],
+                        image["height"],
+                        len(image["labels"]),
+                        file.tell(),
+                        len(data),
+                    ]
+                )
+                file.write(data)
+            file.write(b"\n" + IMAGES_END)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.path)
+
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self.write_index(entries)
+        return entries
+
+    def write_index(self, entries):
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, "w") as file:
+            file.write(json.dumps({"generation": self.generation}) + "\n")
+            for entry in entries:
+                file.write(json.dumps(entry) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.index_path)
+        self.indexed = True
+
+    def append(self, header, images):
+        """
+        Append one save to the journal.
+
+        :param header: Dict with the name, class_names and last_opened of the
+            project.
+        :param images: List of image dicts that changed since the last save.
+        """
+        record = {**header, "generation": self.generation, "images": images}
+        with open(self.journal_path, "a+b") as file:
+            # Start on a new line if the previous write was cut off
+            if file.tell() and not self.ends_with_newline(file):
+                file.write(b"\n")
+            file.write(json.dumps(record).encode() + b"\n")
+            file.flush()
+            os.fsync(file.fileno())
+
+    @staticmethod
+    def ends_with_newline(file):
+        file.seek(-1, os.SEEK_END)
+        return file.read(1) == b"\n"
+
+    def needs_compaction(self):
+        # Files written before the index existed are rewritten on first save
+        if not self.indexed:
+            return True
+        if not os.path.exists(self.journal_path):
+            return False
+        journal_size = os.path.getsize(self.journal_path)
+        if journal_size < JOURNAL_MIN_COMPACT_BYTES:
+            return False
+        return journal_size > os.path.getsize(self.path) * JOURNAL_COMPACT_RATIO
@@ -23,6 +23,54 @@ TOOLBAR_ICON_SIZE = 18
 RIGHT_MAXW = 300
 LOGO_SIZE = 24
 
+DETECTION_CONFIG = "mask-rcnn_r101_fpn_1x_coco"
+DETECTION_WEIGHTS = "weights/model.pth"
+DETECTION_DEVICE = "cpu"
+# Number of detection workers and how many queued crops one inferencer call takes
+DETECTION_WORKERS = 2
+DETECTION_BATCH_SIZE = 4
+# Run workers in separate processes, each owning a model, instead of threads
+DETECTION_USE_PROCESSES = False
+# Selections larger than a tile are detected tile by tile, in pixels
+DETECTION_TILE_SIZE = 1024
+DETECTION_TILE_OVERLAP = 128
+# Contours of neighbouring tiles are one object when their masks overlap at
+# least this much inside the area the tiles share
+DETECTION_TILE_MERGE_IOU = 0.5
+# Images with more pixels than this are displayed from a tiled pyramid
+TILED_RENDERING_PIXELS = 8192 * 8192
+PYRAMID_TILE_SIZE = 512
+# Upper bound of the tile pixmaps kept by a pyramid, in bytes
+PYRAMID_CACHE_BYTES = 256 * 1024 * 1024
+# Upper bound of the decoded images kept for next/previous navigation, in bytes
+IMAGE_CACHE_BYTES = 1024 * 1024 * 1024
+# Number of images decoded ahead in each direction of the image list
+PREFETCH_COUNT = 2
+# Keep every part of detected objects made of several separate parts
+DETECTION_ALL_PARTS = False
+# Seconds after which an unused model is released from the registry
+MODEL_IDLE_TIMEOUT = 600
+# Idle models are released when free memory drops below this many bytes
+MODEL_MIN_FREE_MEMORY = 1024 * 1024 * 1024
+# The project journal is merged into the project file once it grows past this
+# fraction of the project file size
+JOURNAL_COMPACT_RATIO = 0.5
+# ... but never while it is smaller than this many bytes
+JOURNAL_MIN_COMPACT_BYTES = 8 * 1024 * 1024
+# Number of label files written at the same time by the YOLO export
+EXPORT_WORKERS = 16
+# Largest cell of the grid used to find labels at a point or in a rectangle,
+# in pixels. Images with many labels use smaller cells
+LABEL_GRID_CELL_SIZE = 256
+# Diameter of the resize handles of selected labels on screen, in pixels. They
+# keep this size at every zoom level
+HANDLE_SIZE = 7
+# Polygon labels are drawn simplified, leaving out vertices that are closer
+# than this many screen pixels to the simplified outline
+LOD_TOLERANCE = 0.5
+# Polygons with fewer vertices are always drawn with every vertex
+LOD_MIN_VERTICES = 32
+
 
 STYLESHEET = (
     "*:focus {outline: none;} "
@@ -1,65 +1,445 @@
 import cv2
 import numpy as np
-from mmdet.apis import DetInferencer
 from pycocotools import mask as mask_util
 
-from src.widgets.dialogs.error_dialog import ErrorDialog
+from src.models.model_registry import model_registry
+from src.utils.constants import DETECTION_TILE_MERGE_IOU
+from src.utils.functions import simplify_contour
 
 
-def detect_contours(image, confidence_threshold=0.1):
+def detect_contours(image, confidence_threshold=0.1, model=None, all_parts=False):
+    """
+    Detect object contours in the image.
+
+    :param image: Image in BGR order.
+    :param confidence_threshold: Minimum score of a prediction.
+    :param model: LoadedModel to use, the default model from the registry is
+        used when not given.
+    :param all_parts: Keep every part of masks made of several parts instead
+        of only the first one.
+    :return: List of contours or ["no_model_found"].
+    """
+    return detect_contours_batch([image], confidence_threshold, model, all_parts)[0]
+
+
+def detect_contours_batch(
+    images, confidence_threshold=0.1, model=None, all_parts=False
+):
+    """
+    Detect object contours in several images with a single inferencer call.
+
+    :param images: List of images in BGR order.
+    :param confidence_threshold: Minimum score of a prediction.
+    :param model: LoadedModel to use, the default model from the registry is
+        used when not given.
+    :param all_parts: See detect_contours.
+    :return: List with a list of contours (or ["no_model_found"]) per image.
+    """
+    if model is None:
+        try:
+            model = model_registry.get()
+        except FileNotFoundError:
+            return [["no_model_found"] for _ in images]
+
+    output = model(images, batch_size=len(images))
+
+    return [
+        group_contours(prediction_contours(prediction, confidence_threshold, all_parts))
+        for prediction in output["predictions"]
+    ]
+
+
+def prediction_contours(prediction, confidence_threshold, all_parts=False):
+    """
+    Extract contours from the masks of a single image prediction.
+
+    :return: List of (contour, score) tuples.
+    """
     try:
-        inferencer = DetInferencer(
-            "mask-rcnn_r101_fpn_1x_coco",
-            device="cpu",
-            weights="weights/model.pth",
+        score = prediction["scores"][0]
+    except IndexError:
+        return []
+    if score <= confidence_threshold:
+        return []
+
+    all_contours = []
+    for contours in extract_mask_contours(prediction["masks"]):
+        if contours:
+            parts = contours if all_parts else contours[:1]
+            all_contours.extend((contour, score) for contour in parts)
+
+    return all_contours
+
+
+def extract_mask_contours(masks):
+    """
+    Trace the external contours of RLE encoded masks.
+
+    Every mask is decoded straight into its bounding box, so decoding, the
+    binary buffer and the contour search scale with the object, not the
+    frame.
+
+    :param masks: List of RLE masks of the same frame size.
+    :return: List with the contours of every mask, in the order OpenCV finds
+        them in the whole frame.
+    """
+    if not len(masks):
+        return []
+
+    height, width = masks[0]["size"]
+    bboxes = mask_util.toBbox(masks)
+
+    results = []
+    for mask, (x, y, w, h) in zip(masks, bboxes):
+        if w <= 0 or h <= 0:
+            results.append([])
+            continue
+
+        # One pixel of background around the object keeps the traced
+        # contour identical to tracing the whole frame
+        x1, y1 = max(0, int(x) - 1), max(0, int(y) - 1)
+        x2 = min(width, int(np.ceil(x + w)) + 1)
+        y2 = min(height, int(np.ceil(y + h)) + 1)
+        binary_mask = decode_rle_box(rle_counts(mask), height, (x1, y1, x2, y2))
+
+        contours, _ = cv2.findContours(
+            binary_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=(x1, y1)
         )
-    except FileNotFoundError:
-        return ["no_model_found"]
+        results.append(list(contours))
 
-    output = inferencer(image, show=False)
+    return results
 
-    predictions = output["predictions"]
 
-    all_contours = []
-    for prediction in predictions:
-        try:
-            if prediction["scores"][0] > confidence_threshold:
-                for mask_info in prediction["masks"]:
-                    mask_data = mask_util.decode(mask_info)
-                    binary_mask = (mask_data * 255).astype(np.uint8)
-                    contours, _ = cv2.findContours(
-                        binary_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
-                    )
-                    if contours:
-                        all_contours.append(
-                            (contours[0], prediction["scores"][0])
-                        )
-        except IndexError:
+def rle_counts(mask):
+    """
+    Run lengths of an RLE mask, in the column-major order of pycocotools.
+    Runs alternate between background and object, starting with background.
+    """
+    counts = mask["counts"]
+    if isinstance(counts, list):
+        return np.asarray(counts, dtype=np.int64)
+    if isinstance(counts, str):
+        counts = counts.encode()
+
+    # Compressed counts store every run in characters of 5 bits, the 6th bit
+    # marks that the run goes on in the next character
+    chars = np.frombuffer(counts, dtype=np.uint8).astype(np.int64) - 48
+    ends = np.flatnonzero((chars & 0x20) == 0)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    lengths = ends - starts + 1
+    shifts = 5 * (np.arange(len(chars)) - np.repeat(starts, lengths))
+    runs = np.add.reduceat((chars & 0x1F) << shifts, starts)
+    negative = (chars[ends] & 0x10) != 0
+    runs[negative] -= np.left_shift(1, 5 * lengths[negative])
+    # From the fourth run on, runs are stored relative to the run two before
+    runs[2::2] = np.cumsum(runs[2::2])
+    runs[1::2] = np.cumsum(runs[1::2])
+    return runs
+
+
+def decode_rle_box(counts, frame_height, box):
+    """
+    Decode the part of an RLE mask inside a box.
+
+    :param counts: Run lengths from rle_counts.
+    :param frame_height: Height of the frame the mask was encoded in.
+    :param box: (x1, y1, x2, y2) of the part to decode.
+    :return: uint8 array of shape (y2 - y1, x2 - x1) with 1 for the object.
+    """
+    x1, y1, x2, y2 = box
+    run_ends = np.cumsum(counts)
+    # Object runs as ranges of column-major pixel indices, cut to the columns
+    # of the box
+    starts = np.maximum(run_ends[1::2] - counts[1::2], x1 * frame_height)
+    ends = np.minimum(run_ends[1::2], x2 * frame_height)
+    inside = starts < ends
+    starts, ends = starts[inside], ends[inside]
+
+    # Split runs that go on in the next column
+    first_column = starts // frame_height
+    pieces = (ends - 1) // frame_height - first_column + 1
+    column = np.repeat(first_column, pieces) + (
+        np.arange(pieces.sum()) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+    )
+    top = np.clip(np.repeat(starts, pieces) - column * frame_height, y1, y2)
+    bottom = np.clip(np.repeat(ends, pieces) - column * frame_height, y1, y2)
+
+    # Mark where every run starts and stops in each column of the box
+    changes = np.zeros((x2 - x1, y2 - y1 + 1), dtype=np.int8)
+    np.add.at(changes, (column - x1, top - y1), 1)
+    np.add.at(changes, (column - x1, bottom - y1), -1)
+    inside_runs = np.cumsum(changes[:, :-1], axis=1, dtype=np.int8)
+    return np.ascontiguousarray(inside_runs.T).view(np.uint8)
+
+
+def group_contours(all_contours, iou_threshold=None, masks=None):
+    """
+    Merge overlapping contours, keeping the one with the highest score.
+
+    :param all_contours: List of (contour, score) tuples.
+    :param iou_threshold: See group_detections.
+    :param masks: See group_detections.
+    :return: List of contours.
+    """
+    if not all_contours:
+        return []
+
+    boxes = np.array([cv2.boundingRect(contour) for contour, _ in all_contours])
+    scores = np.array([score for _, score in all_contours], dtype=np.float64)
+    keep = group_detections(boxes, scores, iou_threshold, masks)
+    return [all_contours[i][0] for i in keep]
+
+
+def group_detections(boxes, scores, iou_threshold=None, masks=None):
+    """
+    Group overlapping detections and pick the best scoring one of each group.
+
+    Detections are visited in order. Every detection that is still ungrouped
+    takes all later ungrouped detections that overlap it into its group, ties
+    are won by the earlier detection.
+
+    :param boxes: N x 4 array of (x, y, width, height) boxes.
+    :param scores: Array of N scores.
+    :param iou_threshold: When given, boxes only overlap if their IoU is at
+        least this value. By default any intersection counts.
+    :param masks: Optional list of N RLE masks. When given together with
+        iou_threshold, mask IoU is used instead of box IoU.
+    :return: List of indices of the kept detections.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    scores = np.asarray(scores, dtype=np.float64)
+    x1, y1 = boxes[:, 0], boxes[:, 1]
+    x2, y2 = x1 + boxes[:, 2], y1 + boxes[:, 3]
+    areas = boxes[:, 2] * boxes[:, 3]
+
+    ungrouped = np.ones(len(boxes), dtype=bool)
+    keep = []
+    for i in range(len(boxes)):
+        if not ungrouped[i]:
             continue
 
-    grouped_contours = []
-    i = 0
-    while i < len(all_contours):
-        current_contour, current_score = all_contours[i]
-        max_contour, max_score = current_contour, current_score
-
-        j = i + 1
-        while j < len(all_contours):
-            other_contour, other_score = all_contours[j]
-            if contours_overlap(current_contour, other_contour):
-                if other_score > max_score:
-                    max_contour, max_score = other_contour, other_score
-                all_contours.pop(j)
+        others = np.flatnonzero(ungrouped[i + 1 :]) + i + 1
+        overlapping = (
+            (x1[i] < x2[others])
+            & (x2[i] > x1[others])
+            & (y1[i] < y2[others])
+            & (y2[i] > y1[others])
+        )
+        others = others[overlapping]
+
+        if iou_threshold is not None and len(others):
+            if masks is not None:
+                ious = mask_util.iou(
+                    [masks[j] for j in others], [masks[i]], [0] * len(others)
+                ).reshape(-1)
             else:
-                j += 1
+                inter_w = np.minimum(x2[i], x2[others]) - np.maximum(x1[i], x1[others])
+                inter_h = np.minimum(y2[i], y2[others]) - np.maximum(y1[i], y1[others])
+                intersection = inter_w * inter_h
+                ious = intersection / (areas[i] + areas[others] - intersection)
+            others = others[ious >= iou_threshold]
 
-        grouped_contours.append(max_contour)
-        i += 1
+        ungrouped[others] = False
+        group = np.concatenate(([i], others))
+        keep.append(int(group[np.argmax(scores[group])]))
 
-    return grouped_contours
+    return keep
 
 
 def contours_overlap(contour1, contour2):
     x1, y1, w1, h1 = cv2.boundingRect(contour1)
     x2, y2, w2, h2 = cv2.boundingRect(contour2)
     return x1 < x2 + w2 and x1 + w1 > x2 and y1 < y2 + h2 and y1 + h1 > y2
+
+
+def contour_to_polygon(contour, offset=(0, 0)):
+    """
+    Simplify a detected contour and move it to image coordinates.
+
+    :param contour: Contour returned by the detection.
+    :param offset: Position of the detected crop in the image.
+    :return: List of (x, y) points.
+    """
+    offset_x, offset_y = offset
+    simplified_contour = simplify_contour([point[0] for point in contour])
+    return [
+        (point[0][0] + offset_x, point[0][1] + offset_y)
+        for point in simplified_contour
+    ]
+
+
+def generate_tiles(x, y, width, height, tile_size, overlap):
+    """
+    Split a region into overlapping tiles. The last tile of every row and
+    column is aligned with the end of the region, so no tile is smaller than
+    tile_size unless the region itself is.
+
+    :return: List of (x, y, width, height) tuples in image coordinates.
+    """
+    step = max(1, tile_size - overlap)
+
+    def starts(start, length):
+        if length <= tile_size:
+            return [start]
+        positions = list(range(start, start + length - tile_size, step))
+        positions.append(start + length - tile_size)
+        return positions
+
+    x, y, width, height = int(x), int(y), int(round(width)), int(round(height))
+    tile_width = min(tile_size, width)
+    tile_height = min(tile_size, height)
+    return [
+        (tile_x, tile_y, tile_width, tile_height)
+        for tile_y in starts(y, height)
+        for tile_x in starts(x, width)
+    ]
+
+
+def merge_tile_contours(contours, tiles, iou_threshold=DETECTION_TILE_MERGE_IOU):
+    """
+    Merge contours detected in overlapping tiles.
+
+    Objects cut by a tile border are detected in both neighbouring tiles.
+    Two contours of different tiles are the same object when their masks
+    overlap inside the area both tiles cover, touching objects of one tile
+    are never merged. Merged contours are drawn into a mask that covers only
+    their combined bounding box and traced again, so each object ends up as a
+    single contour and memory depends on object size, not region size.
+
+    :param contours: Contours in the coordinates of the whole region.
+    :param tiles: (x, y, width, height) of the tile each contour was
+        detected in, in the same coordinates.
+    :param iou_threshold: Minimum intersection over union of two masks inside
+        the area their tiles share.
+    :return: List of merged contours.
+    """
+    if len(contours) < 2:
+        return list(contours)
+
+    boxes = np.array([cv2.boundingRect(contour) for contour in contours])
+    x1, y1 = boxes[:, 0], boxes[:, 1]
+    x2, y2 = x1 + boxes[:, 2], y1 + boxes[:, 3]
+    tiles = np.array(tiles)
+    tile_x1, tile_y1 = tiles[:, 0], tiles[:, 1]
+    tile_x2, tile_y2 = tile_x1 + tiles[:, 2], tile_y1 + tiles[:, 3]
+
+    # Union-find over contours of the same object
+    parents = list(range(len(contours)))
+
+    def find(i):
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    for i in range(len(contours) - 1):
+        others = slice(i + 1, None)
+        # Area both tiles cover, only there both tiles saw the same pixels
+        shared_x1 = np.maximum(tile_x1[i], tile_x1[others])
+        shared_y1 = np.maximum(tile_y1[i], tile_y1[others])
+        shared_x2 = np.minimum(tile_x2[i], tile_x2[others])
+        shared_y2 = np.minimum(tile_y2[i], tile_y2[others])
+        # Candidates are contours of another tile whose boxes intersect there
+        left = np.maximum(np.maximum(x1[i], x1[others]), shared_x1)
+        top = np.maximum(np.maximum(y1[i], y1[others]), shared_y1)
+        right = np.minimum(np.minimum(x2[i], x2[others]), shared_x2)
+        bottom = np.minimum(np.minimum(y2[i], y2[others]), shared_y2)
+        overlapping = (
+            (tiles[others] != tiles[i]).any(axis=1) & (left < right) & (top < bottom)
+        )
+        for k in np.nonzero(overlapping)[0]:
+            j = int(k) + i + 1
+            if find(i) == find(j):
+                continue
+            # Both masks inside the shared area, clipped to the two boxes
+            rect = (
+                max(shared_x1[k], min(x1[i], x1[j])),
+                max(shared_y1[k], min(y1[i], y1[j])),
+                min(shared_x2[k], max(x2[i], x2[j])),
+                min(shared_y2[k], max(y2[i], y2[j])),
+            )
+            if shared_area_iou(contours[i], contours[j], rect) >= iou_threshold:
+                parents[find(j)] = find(i)
+
+    groups = {}
+    for i in range(len(contours)):
+        groups.setdefault(find(i), []).append(i)
+
+    merged = []
+    for indices in groups.values():
+        if len(indices) == 1:
+            merged.append(contours[indices[0]])
+            continue
+
+        left, top = x1[indices].min(), y1[indices].min()
+        right, bottom = x2[indices].max(), y2[indices].max()
+        mask = np.zeros((bottom - top + 1, right - left + 1), dtype=np.uint8)
+        for i in indices:
+            # One call per contour, overlapping areas of a single call cancel out
+            cv2.drawContours(
+                mask,
+                [contours[i]],
+                -1,
+                255,
+                cv2.FILLED,
+                offset=(-int(left), -int(top)),
+            )
+        group_contours, _ = cv2.findContours(
+            mask,
+            cv2.RETR_EXTERNAL,
+            cv2.CHAIN_APPROX_SIMPLE,
+            offset=(int(left), int(top)),
+        )
+        merged.extend(group_contours)
+
+    return merged
+
+
+def shared_area_iou(contour1, contour2, rect):
+    """
+    Intersection over union of two filled contours inside a rectangle.
+
+    :param rect: (left, top, right, bottom) in the coordinates of the contours.
+    """
+    left, top, right, bottom = (int(value) for value in rect)
+    mask1 = np.zeros((bottom - top, right - left), dtype=np.uint8)
+    mask2 = np.zeros_like(mask1)
+    cv2.drawContours(mask1, [contour1], -1, 1, cv2.FILLED, offset=(-left, -top))
+    cv2.drawContours(mask2, [contour2], -1, 1, cv2.FILLED, offset=(-left, -top))
+    union = np.count_nonzero(mask1 | mask2)
+    if not union:
+        return 0.0
+    return np.count_nonzero(mask1 & mask2) / union
+
+
+def init_detection_process(config, weights, device, num_threads=None):
+    """
+    Initializer of detection worker processes, loads the model of the process.
+
+    :param num_threads: Number of threads torch may use in this process, so
+        that several processes don't oversubscribe the CPU.
+    """
+    if num_threads:
+        import torch
+
+        torch.set_num_threads(num_threads)
+    model_registry.preload(config, weights, device)
+
+
+def run_detection_batch(
+    images, confidence_threshold, config, weights, device, all_parts=False
+):
+    """
+    Run a detection batch inside a worker process.
+
+    :return: Tuple of per-image results, model load time and inference time.
+    """
+    try:
+        model = model_registry.get(config, weights, device)
+    except FileNotFoundError:
+        return [["no_model_found"] for _ in images], 0.0, 0.0
+
+    results = detect_contours_batch(images, confidence_threshold, model, all_parts)
+    # The load happened in the initializer, report it with the first batch only
+    load_time = model.load_time if model.inference_count == 1 else 0.0
+    return results, load_time, model.last_inference_time
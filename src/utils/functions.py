@@ -1,9 +1,15 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import cv2
 import numpy as np
+from PIL import Image
 from PySide6.QtCore import QPointF
 from PySide6.QtGui import QPolygonF, QPen, QBrush
 from PySide6.QtWidgets import QGraphicsPolygonItem
 
+from src.models.image_source import open_mapped_image
+
 
 def points_are_close(point1: QPointF, point2: QPointF, threshold: float = 5.0) -> bool:
     """
@@ -18,23 +24,6 @@ def points_are_close(point1: QPointF, point2: QPointF, threshold: float = 5.0) -
     return (point1 - point2).manhattanLength() < threshold
 
 
-def calculate_handle_size(
-    image_width: int,
-    image_height: int,
-    scale_factor: float = 1.0,
-    min_handle_size: float = 5.0,
-    max_handle_size: float = 20.0,
-) -> float:
-    average_dim = (image_width + image_height) / 2
-    average_dim = 0.01 * average_dim
-
-    scaled_handle_size = average_dim * scale_factor
-
-    scaled_handle_size = max(min_handle_size, min(scaled_handle_size, max_handle_size))
-
-    return scaled_handle_size
-
-
 def simplify_contour(contour, epsilon_factor=0.005):
     """
     Simplify a contour using the Douglas-Peucker algorithm.
@@ -49,3 +38,65 @@ def simplify_contour(contour, epsilon_factor=0.005):
     epsilon = epsilon_factor * cv2.arcLength(contour, True)
     simplified_contour = cv2.approxPolyDP(contour, epsilon, True)
     return simplified_contour
+
+
+def available_memory():
+    """
+    Return the amount of memory available to new allocations in bytes.
+
+    :return: Available memory in bytes or None if it can't be determined.
+    """
+    try:
+        with open("/proc/meminfo", "r") as file:
+            for line in file:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def read_image_size(path):
+    """
+    Read the size of an image from its header, without decoding the pixels.
+
+    :param path: Path to the image.
+    :return: (width, height) tuple.
+    """
+    pixels = open_mapped_image(path)
+    if pixels is not None:
+        return pixels.shape[1], pixels.shape[0]
+
+    with Image.open(path) as image:
+        return image.size
+
+
+def read_image_sizes(paths, max_workers=8, progress_callback=None):
+    """
+    Read the sizes of many images in parallel.
+
+    :param paths: List of image paths.
+    :param max_workers: Number of files read at the same time.
+    :param progress_callback: Called with (done, total) from the calling thread.
+    :return: List of (width, height) tuples in the order of paths, (None, None)
+        for images that couldn't be read.
+    """
+    sizes = [(None, None)] * len(paths)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(read_image_size, path): i for i, path in enumerate(paths)
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            i = futures[future]
+            try:
+                sizes[i] = future.result()
+            except (OSError, ValueError) as e:
+                print(f"Unable to read the size of {paths[i]}: {e}")
+            if progress_callback is not None:
+                progress_callback(done, len(paths))
+
+    return sizes
@@ -1,7 +1,79 @@
-from PySide6.QtWidgets import QStyledItemDelegate
+from PySide6.QtCore import QRect, QSize, Qt
+from PySide6.QtGui import QColor, QFont, QFontMetrics
+from PySide6.QtWidgets import QStyledItemDelegate, QStyle
+
+from src.utils.constants import SELECTED_COLOR
+
+# Second line of TwoLineItemDelegate rows
+SUBTITLE_ROLE = Qt.UserRole
+# Rows where this is True get a highlighted title
+CURRENT_ROLE = Qt.UserRole + 1
 
 
 class ListWidgetDelegate(QStyledItemDelegate):
     def initStyleOption(self, option, index):
         super().initStyleOption(option, index)
         option.text = f"{index.row() + 1}. {option.text}"
+
+
+class TwoLineItemDelegate(QStyledItemDelegate):
+    """
+    Paints a bold title over a gray subtitle, the way TwoLineListItem looks,
+    without creating a widget for every row.
+    """
+
+    PADDING = 9
+    SPACING = 1
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.title_font = QFont()
+        self.title_font.setBold(True)
+        self.title_font.setPixelSize(12)
+        self.title_metrics = QFontMetrics(self.title_font)
+        self.subtitle_font = QFont()
+        self.subtitle_font.setPixelSize(11)
+        self.subtitle_metrics = QFontMetrics(self.subtitle_font)
+
+    def paint(self, painter, option, index):
+        self.initStyleOption(option, index)
+        option.text = ""
+        widget = option.widget
+        widget.style().drawControl(QStyle.CE_ItemViewItem, option, painter, widget)
+
+        rect = option.rect.adjusted(
+            self.PADDING, self.PADDING, -self.PADDING, -self.PADDING
+        )
+        title_rect = QRect(rect)
+        title_rect.setHeight(self.title_metrics.height())
+        subtitle_rect = rect.adjusted(0, title_rect.height() + self.SPACING, 0, 0)
+
+        painter.save()
+        painter.setFont(self.title_font)
+        painter.setPen(QColor(SELECTED_COLOR if index.data(CURRENT_ROLE) else "white"))
+        painter.drawText(
+            title_rect,
+            Qt.AlignLeft | Qt.AlignVCenter,
+            self.title_metrics.elidedText(
+                index.data(Qt.DisplayRole), Qt.ElideRight, title_rect.width()
+            ),
+        )
+        painter.setFont(self.subtitle_font)
+        painter.setPen(QColor("gray"))
+        painter.drawText(
+            subtitle_rect,
+            Qt.AlignLeft | Qt.AlignTop,
+            self.subtitle_metrics.elidedText(
+                index.data(SUBTITLE_ROLE), Qt.ElideMiddle, subtitle_rect.width()
+            ),
+        )
+        painter.restore()
+
+    def sizeHint(self, option, index):
+        return QSize(
+            option.rect.width(),
+            self.title_metrics.height()
+            + self.SPACING
+            + self.subtitle_metrics.height()
+            + 2 * self.PADDING,
+        )
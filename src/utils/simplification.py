@@ -0,0 +1,99 @@
+import numpy as np
+
+
+def vertex_importance(points, min_rank=0):
+    """
+    Rank the vertices of a closed polygon by the Douglas-Peucker tolerance
+    up to which they are kept.
+
+    Douglas-Peucker with tolerance t keeps exactly the vertices whose rank is
+    at least t, so one ranking gives the simplified polygon for any
+    tolerance. The three vertices the simplification starts from are always
+    kept, their rank is infinite.
+
+    :param points: N×2 array of vertices.
+    :param min_rank: Vertices ranked below this get rank 0 without splitting
+        their segments further, which is much faster for dense outlines.
+        Simplifying to a tolerance below min_rank keeps all of them.
+    :return: Array of N ranks.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    count = len(points)
+    ranks = np.full(count, np.inf)
+    if count <= 3:
+        return ranks
+
+    far = int(np.argmax(((points - points[0]) ** 2).sum(axis=1)))
+    if far == 0:
+        # Every vertex is at the same place
+        return ranks
+    # Close the ring so the second half ends at the first vertex again
+    ring = np.vstack([points, points[:1]])
+    # All segments of one depth of the recursion are split together
+    starts = np.array([0, far])
+    ends = np.array([far, count])
+    limits = np.array([np.inf, np.inf])
+    while len(starts):
+        lengths = ends - starts - 1
+        split = lengths > 0
+        starts, ends, limits, lengths = (
+            starts[split],
+            ends[split],
+            limits[split],
+            lengths[split],
+        )
+        if not len(starts):
+            break
+
+        # Index of every inner vertex and of the segment it belongs to
+        segment = np.repeat(np.arange(len(starts)), lengths)
+        first_inner = np.cumsum(lengths) - lengths
+        inner = starts[segment] + 1 + np.arange(len(segment)) - first_inner[segment]
+
+        first, last = ring[starts][segment], ring[ends][segment]
+        direction = last - first
+        offsets = ring[inner] - first
+        length = np.hypot(direction[:, 0], direction[:, 1])
+        cross = np.abs(
+            direction[:, 0] * offsets[:, 1] - direction[:, 1] * offsets[:, 0]
+        )
+        distances = np.where(
+            length > 0,
+            cross / np.where(length > 0, length, 1),
+            np.hypot(offsets[:, 0], offsets[:, 1]),
+        )
+
+        # The first farthest vertex of each segment, like np.argmax
+        largest = np.maximum.reduceat(distances, first_inner)
+        candidates = np.flatnonzero(distances == largest[segment])
+        _, first_candidate = np.unique(segment[candidates], return_index=True)
+        farthest = inner[candidates[first_candidate]]
+
+        close = largest < min_rank
+        ranks[inner[close[segment]]] = 0
+        keep = ~close
+        starts, ends, farthest = starts[keep], ends[keep], farthest[keep]
+        # A vertex can't outlive the vertex that split its segment
+        rank = np.minimum(largest[keep], limits[keep])
+        ranks[farthest] = rank
+        starts, ends = (
+            np.concatenate([starts, farthest]),
+            np.concatenate([farthest, ends]),
+        )
+        limits = np.concatenate([rank, rank])
+
+    # Keep a third vertex so no simplified polygon is a line
+    finite = np.isfinite(ranks)
+    ranks[np.flatnonzero(finite)[np.argmax(ranks[finite])]] = np.inf
+    return ranks
+
+
+def simplify_polygon(points, ranks, tolerance):
+    """
+    :param points: N×2 array of vertices.
+    :param ranks: Ranks of the vertices from vertex_importance.
+    :param tolerance: Largest distance of a removed vertex from the
+        simplified outline.
+    :return: Array of the vertices kept.
+    """
+    return points[ranks >= tolerance]
@@ -0,0 +1,126 @@
+import math
+
+
+class SpatialGrid:
+    """
+    Uniform grid over the bounding boxes of items, used to find the items at
+    a point or in a rectangle without looking at every item.
+
+    Every item is stored in each cell its box overlaps. Items keep the order
+    they were first inserted in, so callers can find the topmost of several
+    overlapping items.
+    """
+
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.boxes = {}
+        self.order = {}
+        self.next_order = 0
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def __contains__(self, item):
+        return item in self.boxes
+
+    @staticmethod
+    def cell_size_for(width, height, count, max_cell_size, min_cell_size=8):
+        """
+        Cell size giving roughly one item per cell when count items are spread
+        over an area of width × height.
+        """
+        cell_size = math.sqrt(width * height / max(count, 1))
+        return max(min_cell_size, min(max_cell_size, cell_size))
+
+    def cell_range(self, box):
+        x1, y1, x2, y2 = box
+        size = self.cell_size
+        return (
+            range(math.floor(x1 / size), math.floor(x2 / size) + 1),
+            range(math.floor(y1 / size), math.floor(y2 / size) + 1),
+        )
+
+    def insert(self, item, box):
+        """
+        :param box: (x_min, y_min, x_max, y_max) of the item.
+        """
+        if item in self.boxes:
+            self.remove(item)
+        else:
+            self.order[item] = self.next_order
+            self.next_order += 1
+
+        self.boxes[item] = box
+        columns, rows = self.cell_range(box)
+        for column in columns:
+            for row in rows:
+                cell = self.cells.get((column, row))
+                if cell is None:
+                    self.cells[(column, row)] = {item}
+                else:
+                    cell.add(item)
+
+    def update(self, item, box):
+        """
+        Move an item to a new box, keeping its order.
+
+        :return: True if the box changed.
+        """
+        if self.boxes.get(item) == box:
+            return False
+        self.insert(item, box)
+        return True
+
+    def remove(self, item):
+        box = self.boxes.pop(item)
+        columns, rows = self.cell_range(box)
+        for column in columns:
+            for row in rows:
+                cell = self.cells[(column, row)]
+                cell.discard(item)
+                if not cell:
+                    del self.cells[(column, row)]
+
+    def discard(self, item):
+        if item in self.boxes:
+            self.remove(item)
+            del self.order[item]
+
+    def at(self, x, y):
+        """
+        :return: Items whose box contains the point, topmost first.
+        """
+        size = self.cell_size
+        cell = self.cells.get((math.floor(x / size), math.floor(y / size)), ())
+        items = []
+        for item in cell:
+            x1, y1, x2, y2 = self.boxes[item]
+            if x1 <= x <= x2 and y1 <= y <= y2:
+                items.append(item)
+        items.sort(key=self.order.__getitem__, reverse=True)
+        return items
+
+    def intersecting(self, box):
+        """
+        :return: Set of items whose box intersects box.
+        """
+        columns, rows = self.cell_range(box)
+        if len(columns) * len(rows) >= len(self.cells):
+            # Looking up the cells would take longer than checking every box
+            candidates = self.boxes
+        else:
+            candidates = set()
+            for column in columns:
+                for row in rows:
+                    cell = self.cells.get((column, row))
+                    if cell is not None:
+                        candidates.update(cell)
+
+        left, top, right, bottom = box
+        items = set()
+        for item in candidates:
+            x1, y1, x2, y2 = self.boxes[item]
+            if x1 <= right and x2 >= left and y1 <= bottom and y2 >= top:
+                items.add(item)
+        return items
@@ -1,13 +1,11 @@
-﻿import os
-
-from PySide6.QtCore import QSize, Qt, QEvent, QModelIndex, QItemSelectionModel
+﻿from PySide6.QtCore import QSize, Qt, QEvent, QModelIndex, QItemSelectionModel, QTimer
 from PySide6.QtGui import QAction, QIcon
 from PySide6.QtWidgets import (
     QVBoxLayout,
     QHBoxLayout,
     QWidget,
     QToolBar,
-    QListWidget,
+    QListView,
     QLabel,
     QPushButton,
     QComboBox,
@@ -17,15 +15,16 @@ from PySide6.QtWidgets import (
 )
 
 from src.models.anno_project import AnnoProject
+from src.models.image_list_model import ImageListModel
+from src.models.label_list_model import LabelListModel
 from src.models.label_image import LabelImage
 from src.utils.constants import *
+from src.utils.list_widget_delegate import TwoLineItemDelegate
 from src.widgets.dialogs.convert_dialog import ExportDialog
 from src.widgets.dialogs.labels_manage_dialog import LabelsManageDialog
 from src.widgets.dialogs.yes_or_no_dialog import YesOrNoDialog
 from src.widgets.image_view import ImageView
-from src.widgets.labels.rectangle_item import RectangleItem
 from src.widgets.logo_label import LogoLabel
-from src.widgets.two_line_list_item import TwoLineListItem
 
 
 class AppGui(QVBoxLayout):
@@ -149,20 +148,33 @@ class AppGui(QVBoxLayout):
         self.center_layout = QVBoxLayout()
 
         self.image_view = ImageView(parent=self)
-        self.image_view.labels_updated.connect(self.update_project)
+        # Edits are written to the project and the label list once per event
+        # loop cycle, however many labels_updated signals they emit
+        self.project_update_timer = QTimer(self)
+        self.project_update_timer.setSingleShot(True)
+        self.project_update_timer.setInterval(0)
+        self.project_update_timer.timeout.connect(self.update_project)
+        self.image_view.labels_updated.connect(self.project_update_timer.start)
+        self.image_view.labels_loaded.connect(self.reset_labels_list)
         self.image_view.drawing_label.connect(self.update_box_size_label)
         self.image_view.on_image_loaded.connect(self.load_labels)
-        self.image_view.scene().selectionChanged.connect(self.update_selection)
+        self.image_view.selection_changed.connect(self.update_selection)
 
         self.center_layout.addWidget(self.image_view)
 
         self.right_panel_layout = QVBoxLayout()
 
         self.labels_label = QLabel("Labels")
-        self.labels_list = QListWidget()
-        self.labels_list.setSelectionMode(QListWidget.SingleSelection)
+        self.labels_model = LabelListModel(self)
+        self.labels_list = QListView()
+        self.labels_list.setModel(self.labels_model)
+        self.labels_list.setItemDelegate(TwoLineItemDelegate(self.labels_list))
+        self.labels_list.setUniformItemSizes(True)
+        self.labels_list.setSelectionMode(QListView.SingleSelection)
         self.labels_list.setMaximumWidth(RIGHT_MAXW)
-        self.labels_list.itemSelectionChanged.connect(self.select_labels_from_list)
+        self.labels_list.selectionModel().selectionChanged.connect(
+            self.select_labels_from_list
+        )
         self.labels_list.installEventFilter(self)
 
         self.label_name_selector = QComboBox()
@@ -175,8 +187,13 @@ class AppGui(QVBoxLayout):
         self.manage_labels_button.clicked.connect(self.manage_labels)
 
         self.images_label = QLabel("Images")
-        self.images_list = QListWidget()
-        self.images_list.setSelectionMode(QListWidget.ExtendedSelection)
+        self.images_model = ImageListModel(self.anno_project, self)
+        self.images_list = QListView()
+        self.images_list.setModel(self.images_model)
+        self.images_list.setItemDelegate(TwoLineItemDelegate(self.images_list))
+        # Rows have the same height, so the view never measures every row
+        self.images_list.setUniformItemSizes(True)
+        self.images_list.setSelectionMode(QListView.ExtendedSelection)
         self.images_list.setMaximumWidth(RIGHT_MAXW)
         self.images_list.doubleClicked.connect(self.load_image)
         self.images_list.installEventFilter(self)
@@ -228,18 +245,17 @@ class AppGui(QVBoxLayout):
 
     def eventFilter(self, source, event):
         if event.type() == QEvent.ContextMenu and source is self.labels_list:
-            item = source.itemAt(event.pos())
+            index = source.indexAt(event.pos())
             menu = QMenu()
-            item_text = self.labels_list.itemWidget(item).title
-            if item is not None:
+            item_text = index.data()
+            if index.isValid():
                 label_combobox = QComboBox()
                 label_combobox.addItems(self.anno_project.class_names)
+                label_item = self.image_view.labels_by_name.get(item_text)
+                if label_item is None:
+                    return
+                label_id = label_item.label_name_id
                 try:
-                    label_item = [
-                        label for label in self.image_view.current_labels
-                        if label.label_name == item_text
-                    ][0]
-                    label_id = label_item.label_name_id
                     label_combobox.setCurrentText(self.anno_project.class_names[label_id])
                 except IndexError:
                     return
@@ -265,28 +281,25 @@ class AppGui(QVBoxLayout):
 
             return True
         elif event.type() == QEvent.ContextMenu and source is self.images_list:
-            item = source.itemAt(event.pos())
+            index = source.indexAt(event.pos())
             menu = QMenu()
 
-            if item is not None:
+            if index.isValid():
                 menu.addAction("Load image")
                 menu.addAction("Count labels")
                 selected_menu = menu.exec_(event.globalPos())
                 if selected_menu is None:
                     return True
                 elif selected_menu.text() == "Load image":
-                    self.load_image(
-                        self.anno_project.images[self.images_list.row(item)]
-                    )
+                    self.load_image(index)
                 elif selected_menu.text() == "Count labels":
-                    self.count_labels(
-                        self.anno_project.images[self.images_list.row(item)]
-                    )
+                    self.count_labels(self.anno_project.images[index.row()])
 
             return True
         return super(QVBoxLayout, self).eventFilter(source, event)
 
     def back_to_home(self):
+        self.apply_pending_update()
         if not self.anno_project.is_saved():
             yes_or_no_dialog = YesOrNoDialog(
                 title="Unsaved changes",
@@ -309,6 +322,7 @@ class AppGui(QVBoxLayout):
         """
         Exports project
         """
+        self.apply_pending_update()
         export_dialog = ExportDialog(self.anno_project)
         export_dialog.exec()
 
@@ -321,13 +335,12 @@ class AppGui(QVBoxLayout):
         """
         Changes label name
         """
-        for label in self.image_view.current_labels:
-            if label.label_name == label_name:
-                label.label_name = self.image_view.generate_label_name(new_label)
-                label.label_name_id = self.anno_project.class_names.index(
-                    new_label
-                )
-                break
+        label = self.image_view.labels_by_name.get(label_name)
+        if label is not None:
+            self.image_view.rename_label(
+                label, self.image_view.generate_label_name(new_label)
+            )
+            label.label_name_id = self.anno_project.class_names.index(new_label)
 
         self.update_project()
 
@@ -335,16 +348,15 @@ class AppGui(QVBoxLayout):
         """
         Updates image list widget with images from project
         """
-        self.images_list.clear()
-        for image in self.anno_project.images:
-            item_widget = TwoLineListItem(image.name, os.path.dirname(image.path))
-            item_widget.add_to_list(self.images_list)
+        self.images_model.reset()
 
     def load_image(self, image: LabelImage or QModelIndex):
         """
         Loads image to image viewer
         :type image: LabelImage
         """
+        # Edits of the image being left must not be written to the next one
+        self.apply_pending_update()
         index = None
         if type(image) is QModelIndex:
             index = image.row()
@@ -357,40 +369,65 @@ class AppGui(QVBoxLayout):
             self.anno_project.set_current_image(image)
             self.image_view.load_image(image)
 
-        for i in range(self.images_list.count()):
-            item = self.images_list.item(i)
-            widget = self.images_list.itemWidget(item)
-            if isinstance(widget, TwoLineListItem):
-                if i == index:
-                    widget.set_selected(True)
-                else:
-                    widget.set_selected(False)
+        if index is not None:
+            self.images_model.set_current_row(index)
+            self.prefetch_neighbours(index)
+
+    def prefetch_neighbours(self, index):
+        """
+        Starts decoding the images around index, the next ones first
+        """
+        neighbours = []
+        for distance in range(1, PREFETCH_COUNT + 1):
+            for neighbour in (index + distance, index - distance):
+                if 0 <= neighbour < len(self.anno_project.images):
+                    neighbours.append(self.anno_project.images[neighbour])
+        self.image_view.prefetch(neighbours)
 
     def load_labels(self):
         """
         Loads labels from current image to image viewer
         """
+        current_image = self.anno_project.current_image
+        if current_image.width is None:
+            # Projects created lazily learn image sizes when images are opened
+            current_image.width = self.image_view.image_width
+            current_image.height = self.image_view.image_height
+            self.anno_project.mark_dirty(current_image)
         self.image_view.load_labels(self.anno_project.current_image.labels)
 
     def update_project(self):
         """
         Updates project with current labels from image viewer
         """
-        try:
-            self.anno_project.current_image.labels = [
-                item.to_dict() for item in self.image_view.current_labels
-            ]
-        except AttributeError:
+        self.project_update_timer.stop()
+        if self.anno_project.current_image is None:
             return
+        self.anno_project.set_labels(
+            self.anno_project.current_image,
+            [item.to_dict() for item in self.image_view.current_labels],
+        )
         self.check_if_saved()
+        self.update_labels_list()
 
-        self.labels_list.clear()
-        for item in self.image_view.current_labels:
-            list_widget = TwoLineListItem(
-                item.label_name,
-                "Rectangle" if isinstance(item, RectangleItem) else "Polygon",
-            )
-            list_widget.add_to_list(self.labels_list)
+    def apply_pending_update(self):
+        """
+        Write edits still waiting for project_update_timer to the project
+        """
+        if self.project_update_timer.isActive():
+            self.update_project()
+
+    def update_labels_list(self):
+        """
+        Updates the rows of the labels list that changed since the last update
+        """
+        self.labels_model.set_labels(self.image_view.current_labels)
+
+    def reset_labels_list(self):
+        """
+        Fills labels list with the labels of a newly loaded image
+        """
+        self.labels_model.reset_labels(self.image_view.current_labels)
 
     def check_if_saved(self):
         if self.anno_project.is_saved():
@@ -421,6 +458,7 @@ class AppGui(QVBoxLayout):
             self.image_view.label_id = None
 
     def save_project(self):
+        self.apply_pending_update()
         self.anno_project.save_project()
         self.check_if_saved()
 
@@ -441,18 +479,13 @@ class AppGui(QVBoxLayout):
         self.update_project()
 
     def delete_selected_photos(self):
-        selected_items = self.images_list.selectedItems()
-        selected_images = [item.text() for item in selected_items]
-        images_to_delete = [
+        selected_rows = {index.row() for index in self.images_list.selectedIndexes()}
+        self.anno_project.images = [
             image
-            for image in self.anno_project.images
-            if os.path.basename(image) in selected_images
+            for row, image in enumerate(self.anno_project.images)
+            if row not in selected_rows
         ]
-        for image in images_to_delete:
-            self.anno_project.images.remove(image)
-
-        self.images_list.clear()
-        self.images_list.addItems([image.name for image in self.anno_project.images])
+        self.update_image_list()
 
     def update_selection(self):
         if self.updating_selection:
@@ -461,17 +494,12 @@ class AppGui(QVBoxLayout):
         self.updating_selection = True
         self.labels_list.clearSelection()
 
-        for item in self.image_view.current_labels:
-            if item.isSelected():
-                for index in range(self.labels_list.count()):
-                    list_item = self.labels_list.item(index)
-                    widget = self.labels_list.itemWidget(list_item)
-                    if isinstance(widget, TwoLineListItem):
-                        if widget and widget.title == item.label_name:
-                            print(f"{widget.title} == {item.label_name}")
-                            self.labels_list.setCurrentItem(
-                                list_item, QItemSelectionModel.Select
-                            )
+        for item in self.image_view.selected_labels:
+            row = self.labels_model.row_of(item)
+            if item.isSelected() and row is not None:
+                self.labels_list.selectionModel().setCurrentIndex(
+                    self.labels_model.index(row), QItemSelectionModel.Select
+                )
         self.updating_selection = False
 
     def select_labels_from_list(self):
@@ -480,8 +508,7 @@ class AppGui(QVBoxLayout):
 
         self.updating_selection = True
 
-        selected_items = self.labels_list.selectedItems()
-        selected_labels = [self.labels_list.itemWidget(item).title for item in selected_items]
+        selected_labels = [index.data() for index in self.labels_list.selectedIndexes()]
 
         self.image_view.select_labels(selected_labels)
         self.updating_selection = False
@@ -513,6 +540,7 @@ class AppGui(QVBoxLayout):
         self.rectangle_button.setChecked(False)
         self.auto_detect_button.setChecked(True)
         self.image_view.set_mode("detection")
+        self.image_view.detection_queue.preload_model()
 
     def previous_image(self):
         current_image = self.anno_project.current_image
@@ -1,3 +1,5 @@
+import time
+
 from PySide6.QtCore import Qt
 from PySide6.QtGui import QFont
 from PySide6.QtWidgets import (
@@ -12,8 +14,13 @@ from PySide6.QtWidgets import (
     QFileDialog,
     QWidget,
     QSizePolicy,
+    QProgressBar,
+    QCheckBox,
 )
 
+from src.models.export_worker import ExportWorker
+from src.widgets.dialogs.error_dialog import ErrorDialog
+
 
 class ExportDialog(QDialog):
     def __init__(self, anno_project):
@@ -62,6 +69,10 @@ class ExportDialog(QDialog):
         self.layout.addWidget(self.empty_files_label)
         self.layout.addWidget(self.empty_files_options)
 
+        # COCO options
+        self.compact_checkbox = QCheckBox("Compact JSON (no indentation)")
+        self.layout.addWidget(self.compact_checkbox)
+
         self.toggle_yolo_options()
 
         # Save path
@@ -79,6 +90,14 @@ class ExportDialog(QDialog):
         self.layout.addWidget(self.save_path_label)
         self.layout.addLayout(self.save_path_layout)
 
+        # Progress - hidden until the export starts
+        self.progress_bar = QProgressBar()
+        self.progress_label = QLabel()
+        self.progress_bar.setVisible(False)
+        self.progress_label.setVisible(False)
+        self.layout.addWidget(self.progress_bar)
+        self.layout.addWidget(self.progress_label)
+
         # Action buttons
         self.layout.addStretch()
         self.export_button = QPushButton("Export")
@@ -86,6 +105,9 @@ class ExportDialog(QDialog):
         self.export_button.setEnabled(False)
         self.cancel_button = QPushButton("Cancel")
         self.cancel_button.clicked.connect(self.reject)
+
+        self.worker = None
+        self.start_time = None
         self.layout.addWidget(self.export_button)
         self.layout.addWidget(self.cancel_button)
 
@@ -95,6 +117,7 @@ class ExportDialog(QDialog):
         self.polygon_options.setVisible(is_yolo)
         self.empty_files_label.setVisible(is_yolo)
         self.empty_files_options.setVisible(is_yolo)
+        self.compact_checkbox.setVisible(not is_yolo)
 
     def browse(self):
         folder_path = QFileDialog.getExistingDirectory(self, "Select a directory")
@@ -116,7 +139,62 @@ class ExportDialog(QDialog):
         )
         save_path = self.save_path_line_edit.text()
 
-        self.anno_project.export_project(
-            dataset_type, ignore_polygons, save_empty_files, save_path
+        for widget in (
+            self.dataset_type_combo,
+            self.polygon_options,
+            self.empty_files_options,
+            self.compact_checkbox,
+            self.browse_button,
+            self.export_button,
+        ):
+            widget.setEnabled(False)
+        self.progress_bar.setValue(0)
+        self.progress_bar.setVisible(True)
+        self.progress_label.setText("Preparing...")
+        self.progress_label.setVisible(True)
+
+        self.worker = ExportWorker(
+            self.anno_project,
+            dataset_type,
+            ignore_polygons,
+            save_empty_files,
+            save_path,
+            compact=self.compact_checkbox.isChecked(),
         )
-        self.accept()
+        self.worker.progress.connect(self.update_progress)
+        self.worker.finished.connect(self.export_finished)
+        self.start_time = time.monotonic()
+        self.worker.start()
+
+    def update_progress(self, done, total):
+        self.progress_bar.setMaximum(total)
+        self.progress_bar.setValue(done)
+        elapsed = time.monotonic() - self.start_time
+        speed = done / elapsed if elapsed > 0 else 0
+        self.progress_label.setText(f"{done}/{total} images ({speed:.1f} images/s)")
+
+    def export_finished(self):
+        worker = self.worker
+        self.worker = None
+        if worker.error is not None:
+            error_dialog = ErrorDialog(
+                widget=self,
+                window_title="Error",
+                title="Export failed",
+                text=str(worker.error),
+            )
+            error_dialog.exec()
+            self.reject()
+        elif worker.cancelled:
+            self.reject()
+        else:
+            self.accept()
+
+    def reject(self):
+        # Stop a running export first, the dialog closes when it has finished
+        if self.worker is not None:
+            self.worker.cancel()
+            self.cancel_button.setEnabled(False)
+            self.progress_label.setText("Cancelling...")
+            return
+        super().reject()
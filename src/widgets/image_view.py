@@ -1,9 +1,7 @@
 from functools import partial
 
-import cv2
-import numpy as np
 from PIL import Image
-from PySide6.QtCore import QPointF, Qt, Signal, QEvent, QTimer
+from PySide6.QtCore import QPointF, QRectF, Qt, Signal, QEvent, QTimer
 from PySide6.QtWidgets import (
     QGraphicsView,
     QGraphicsScene,
@@ -17,30 +15,53 @@ from PySide6.QtGui import (
     QMouseEvent,
     QPolygonF,
     QImage,
+    QPixmap,
 )
 
 from src.models.detection_models import DetectionQueue, DetectionTask
-from src.utils.constants import SURFACE_COLOR
+from src.utils.constants import (
+    SURFACE_COLOR,
+    DETECTION_TILE_SIZE,
+    DETECTION_TILE_OVERLAP,
+    DETECTION_ALL_PARTS,
+    LABEL_GRID_CELL_SIZE,
+)
 from src.models.label_image import LabelImage
-from src.utils.detection import detect_contours
-from src.utils.functions import points_are_close, simplify_contour
+from src.utils.detection import contour_to_polygon, generate_tiles
+from src.utils.functions import points_are_close
+from src.utils.spatial_grid import SpatialGrid
 from src.widgets.dialogs.add_label_dialog import AddLabelDialog
 from src.widgets.dialogs.error_dialog import ErrorDialog
+from src.widgets.labels.label_layer import LabelLayer, SELECTED_Z_VALUE
 from src.widgets.labels.polygon_item import PolygonItem
 from src.widgets.labels.rectangle_item import RectangleItem
-from src.models.image_loader import ImageLoader
+from src.models.image_cache import ImageCache, ImagePrefetcher
+from src.models.image_loader import ImageLoader, decode_image
+from src.models.image_pyramid import ImagePyramid
+from src.widgets.tiled_image_item import TiledImageItem
 
 Image.MAX_IMAGE_PIXELS = 933120000
 
 
 class ImageView(QGraphicsView):
     labels_updated = Signal()
+    labels_loaded = Signal()
+    selection_changed = Signal()
     drawing_label = Signal(tuple, bool)
     on_image_loaded = Signal()
 
     def __init__(self, parent=None):
         super().__init__()
         self.image_loader = None
+        # (path, image) of the displayed image, replaced in one assignment so
+        # detection workers never see the image of one path with another path
+        self.loaded_source = None
+        self.requested_image = None
+        self.image_cache = ImageCache()
+        self.prefetcher = ImagePrefetcher(
+            self.image_cache,
+            partial(decode_image, max_pixels=self.image_cache.max_bytes // 4),
+        )
         self.drawing = False
         self.start_point = None
         self.end_point = None
@@ -48,6 +69,7 @@ class ImageView(QGraphicsView):
         self.label_name = None
         self.label_id = None
         self.image_id = None
+        self.image_path = None
         self.polygon_points = []
         self.polygon_item = None
         self.initial_zoom = 1
@@ -56,7 +78,24 @@ class ImageView(QGraphicsView):
         self.min_zoom = 1.0
         self.output_path = None
         self.current_labels = []
-        self.detection_queue = DetectionQueue()
+        # Bounding boxes of current_labels for hit-testing and culling
+        self.label_index = SpatialGrid(LABEL_GRID_CELL_SIZE)
+        # Label items by label name, and the next number tried for each class
+        # by generate_label_name, which is only called for labels that are
+        # added
+        self.labels_by_name = {}
+        self.label_name_counters = {}
+        # Selected labels are scene items with handles, the rest is painted
+        # by label_layer
+        self.selected_labels = set()
+        self.label_layer = None
+        self.changing_selection = False
+        self.rubber_band_rect = None
+        # Set while selected labels are dragged, until the mouse is released
+        self.labels_moved = False
+        # Split large detection regions into overlapping tiles
+        self.tiled_detection = True
+        self.detection_queue = DetectionQueue(image_source=self.image_source)
         self.detection_queue.task_completed.connect(self.on_detection_task_finished)
 
         self.timer = QTimer(self)
@@ -77,6 +116,8 @@ class ImageView(QGraphicsView):
         self.setTransformationAnchor(QGraphicsView.AnchorUnderMouse)
         self.setResizeAnchor(QGraphicsView.AnchorUnderMouse)
         self.setRubberBandSelectionMode(Qt.IntersectsItemShape)
+        self.rubberBandChanged.connect(self.rubber_band_changed)
+        self.scene().selectionChanged.connect(self.scene_selection_changed)
 
         self.horizontalScrollBar().setFixedHeight(10)
         self.verticalScrollBar().setFixedWidth(10)
@@ -100,21 +141,22 @@ class ImageView(QGraphicsView):
 
         self.current_scale *= 1 / zoom_factor
         self.current_zoom *= zoom_factor
+        # Handles ignore the view transformation, nothing to resize here
         self.scale(zoom_factor, zoom_factor)
-        self.update_handle_scales(self.current_scale)
-
-    def update_handle_scales(self, scale_factor):
-        """
-        Update the scale of handles for each RectangleItem in the scene.
-        """
-        for item in self.current_labels:
-            item.update_handle_scale(scale_factor)
 
     def load_image(self, label_image: LabelImage):
         """
         Load image from path
+        Images found in the cache are shown immediately. While another image is
+        being decoded, the newest request is remembered and loaded next.
         :param label_image: LabelImage object
         """
+        self.requested_image = label_image
+        cached_image = self.image_cache.get(label_image.path)
+        if cached_image is not None:
+            self.image_loaded(label_image.image_id, cached_image)
+            return
+
         if self.loading_image:
             return
 
@@ -126,35 +168,65 @@ class ImageView(QGraphicsView):
         )
         self.loading_label.setVisible(True)
 
-        self.image_loader = ImageLoader(label_image.path)
+        self.image_loader = ImageLoader(label_image.path, self.image_cache)
         self.image_loader.loaded.connect(
-            partial(self.image_loaded, label_image.image_id)
+            partial(self.loader_finished, label_image.image_id)
         )
         self.image_loader.start()
 
-    def image_loaded(self, image_id, pixmap):
+    def loader_finished(self, image_id, image):
         """
-        Called when image is loaded
-        :param pixmap: QPixmap object
+        Called when the loader thread has decoded an image
+        Results of images that are no longer wanted are only kept in the cache.
         """
         self.loading_image = False
-        if pixmap.width() == 0:
+        requested_image = self.requested_image
+        if requested_image.image_id == image_id:
+            self.image_loaded(image_id, image)
+        elif requested_image.image_id != self.image_id:
+            self.loading_label.setVisible(False)
+            self.load_image(requested_image)
+        else:
+            self.loading_label.setVisible(False)
+
+    def prefetch(self, label_images):
+        """
+        Decode images in the background so that opening them is instant
+        :param label_images: list of LabelImage objects, most likely first
+        """
+        self.prefetcher.prefetch([label_image.path for label_image in label_images])
+
+    def image_loaded(self, image_id, image):
+        """
+        Called when image is loaded
+        :param image: DecodedImage, ImagePyramid for very large images or None
+            if the image couldn't be decoded
+        """
+        if image is None:
             QMessageBox.critical(
                 self, "Error", "Unable to load the image.", QMessageBox.Ok
             )
             self.loading_label.setVisible(False)
             return
 
+        self.clear_selection()
         self.scene().clear()
-        self.scene().addPixmap(pixmap)
-        self.image_width = pixmap.width()
-        self.image_height = pixmap.height()
+        if isinstance(image, ImagePyramid):
+            self.scene().addItem(TiledImageItem(image))
+        else:
+            self.scene().addPixmap(QPixmap.fromImage(image.qimage))
+        self.loaded_source = (self.requested_image.path, image)
+        self.image_width = image.width
+        self.image_height = image.height
 
         self.fitInView(self.scene().items()[0], Qt.KeepAspectRatio)
         self.scene().setSceneRect(0, 0, self.image_width, self.image_height)
+        self.label_layer = LabelLayer(self)
+        self.scene().addItem(self.label_layer)
 
         self.on_image_loaded.emit()
         self.image_id = image_id
+        self.image_path = self.requested_image.path
         self.image_label.setVisible(False)
         self.loading_label.setVisible(False)
         self.set_mode(self.current_mode)
@@ -167,7 +239,7 @@ class ImageView(QGraphicsView):
         :param result: The result of the detection, typically a list of detected contours.
         """
         try:
-            if results[0] == "no_model_found":
+            if isinstance(results[0], str) and results[0] == "no_model_found":
                 error_dialog = ErrorDialog(
                     widget=self,
                     window_title="Error",
@@ -180,14 +252,9 @@ class ImageView(QGraphicsView):
 
         except:
             pass
-        offset_x, offset_y = task.image_part_position
         if results:
             for item in results:
-                adjusted_contour = simplify_contour([point[0] for point in item])
-                adjusted_contour = [
-                    (point[0][0] + offset_x, point[0][1] + offset_y)
-                    for point in adjusted_contour
-                ]
+                adjusted_contour = contour_to_polygon(item, task.image_part_position)
                 polygon = QPolygonF(
                     [QPointF(point[0], point[1]) for point in adjusted_contour]
                 )
@@ -197,10 +264,10 @@ class ImageView(QGraphicsView):
                     self.generate_label_name(task.label_name),
                     self.label_id,
                 )
-                self.scene().addItem(polygon_item)
-                self.current_labels.append(polygon_item)
+                self.add_label(polygon_item)
 
-                self.labels_updated.emit()
+            self.label_layer.update()
+            self.labels_updated.emit()
         self.parent.update_queue_count()
         self.set_mode(self.current_mode)
 
@@ -209,34 +276,73 @@ class ImageView(QGraphicsView):
         Load labels from list
         :param labels: list of labels
         """
+        self.clear_selection()
         self.current_labels = []
+        self.labels_by_name = {}
+        self.label_name_counters = {}
+        self.label_index = SpatialGrid(
+            SpatialGrid.cell_size_for(
+                self.image_width, self.image_height, len(labels), LABEL_GRID_CELL_SIZE
+            )
+        )
         for label in labels:
             if label["type"] == "RectangleItem":
-                new_label = RectangleItem.from_dict(label, self)
-                self.current_labels.append(new_label)
-                self.scene().addItem(new_label)
+                self.add_label(RectangleItem.from_dict(label, self))
             elif label["type"] == "PolygonItem":
-                new_label = PolygonItem.from_dict(label, self)
-                self.current_labels.append(new_label)
-                self.scene().addItem(new_label)
+                self.add_label(PolygonItem.from_dict(label, self))
 
+        self.label_layer.update()
         self.set_mode(self.current_mode)
-        self.labels_updated.emit()
-        self.update_handle_scales(self.current_scale)
-        self.resize_enable()
+        self.labels_loaded.emit()
+
+    def add_label(self, item):
+        self.current_labels.append(item)
+        self.labels_by_name[item.label_name] = item
+        self.label_index.insert(item, self.label_box(item))
+
+    def rename_label(self, item, label_name):
+        if self.labels_by_name.get(item.label_name) is item:
+            del self.labels_by_name[item.label_name]
+        item.label_name = label_name
+        self.labels_by_name[label_name] = item
+
+    @staticmethod
+    def label_box(item):
+        """
+        :return: (x_min, y_min, x_max, y_max) of a label item
+        """
+        rect = LabelLayer.label_polygon(item).boundingRect()
+        return rect.left(), rect.top(), rect.right(), rect.bottom()
+
+    def update_selected_boxes(self):
+        """
+        Update label_index after selected labels were moved or resized, the
+        other labels can't change.
+        :return: True if a box changed
+        """
+        changed = False
+        for item in self.selected_labels:
+            changed |= self.label_index.update(item, self.label_box(item))
+        return changed
 
     def update_labels(self):
-        self.labels_updated.emit()
+        """
+        Called by label items on every move while they are dragged, the change
+        is committed with labels_updated when the mouse is released.
+        """
+        self.labels_moved = True
+        self.update_selected_boxes()
 
     def update_label_names(self):
         """
         Update label names with class names from project
         """
         for item in self.current_labels:
-            item.label_name = (
+            self.rename_label(
+                item,
                 self.parent.anno_project.class_names[int(item.label_name_id)]
                 + " "
-                + item.label_name.split(" ")[-1]
+                + item.label_name.split(" ")[-1],
             )
 
         self.labels_updated.emit()
@@ -255,10 +361,16 @@ class ImageView(QGraphicsView):
     def mousePressEvent(self, event):
         if event.button() == Qt.LeftButton and self.current_mode == "select":
             item = self.itemAt(event.pos())
-            if item:
-                for i in self.scene().items():
-                    i.setSelected(False)
-                item.setSelected(True)
+            # Selected labels and their handles handle the press themselves
+            if item is None or item.topLevelItem().zValue() < SELECTED_Z_VALUE:
+                label = self.label_at(self.mapToScene(event.pos()))
+                if label is not None and event.modifiers() & Qt.ControlModifier:
+                    self.set_selection(self.selected_labels | {label})
+                    return
+                elif label is not None:
+                    # The label is now a scene item and gets the press, so it
+                    # can be dragged right away
+                    self.set_selection({label})
         elif event.button() == Qt.LeftButton and (
             self.current_mode == "rect_selection" or self.current_mode == "detection"
         ):
@@ -326,8 +438,8 @@ class ImageView(QGraphicsView):
                 self.scene().removeItem(self.rect_item)
                 return
 
-        self.current_labels.append(item)
-        self.scene().addItem(item)
+        self.add_label(item)
+        self.label_layer.update()
         if isinstance(item, RectangleItem):
             size = (item.rect().width(), item.rect().height())
         elif isinstance(item, PolygonItem):
@@ -335,7 +447,6 @@ class ImageView(QGraphicsView):
         else:
             raise ValueError("Unexpected item type")
 
-        self.update_handle_scales(self.current_scale)
         self.labels_updated.emit()
         self.drawing_label.emit(size, False)
 
@@ -360,6 +471,10 @@ class ImageView(QGraphicsView):
 
         self.set_mode(self.current_mode)
         super().mouseReleaseEvent(event)
+        # Rectangle handles resize labels without calling update_labels
+        if self.update_selected_boxes() or self.labels_moved:
+            self.labels_moved = False
+            self.labels_updated.emit()
 
     def handle_rectangle_label(self):
         """
@@ -448,7 +563,7 @@ class ImageView(QGraphicsView):
             self,
             self.start_point,
             self.end_point,
-            self.generate_label_name(self.label_name),
+            self.label_name,
             self.label_id,
             temporary=True,
         )
@@ -508,8 +623,8 @@ class ImageView(QGraphicsView):
             self.generate_label_name(self.label_name),
             self.label_id,
         )
-        self.current_labels.append(polygon_item)
-        self.scene().addItem(polygon_item)
+        self.add_label(polygon_item)
+        self.label_layer.update()
         self.labels_updated.emit()
         self.drawing_label.emit((0, 0), False)
         self.drawing = False
@@ -527,29 +642,51 @@ class ImageView(QGraphicsView):
 
         self.remove_temporary_items()
 
-        cropped_image, coords = self.crop_image(x, y, width, height)
-        task = DetectionTask(
-            image=cropped_image,
-            original_image_id=self.image_id,
-            image_part_position=coords,
-            label_name=self.label_name,
-            confidence_threshold=0.1,
-        )
-        self.detection_queue.add_task(task)
+        if self.tiled_detection and (
+            width > DETECTION_TILE_SIZE or height > DETECTION_TILE_SIZE
+        ):
+            task = DetectionTask(
+                image=None,
+                original_image_id=self.image_id,
+                image_part_position=(int(x), int(y)),
+                label_name=self.label_name,
+                params={"all_parts": DETECTION_ALL_PARTS},
+                confidence_threshold=0.1,
+                path=self.image_path,
+            )
+            tiles = generate_tiles(
+                x, y, width, height, DETECTION_TILE_SIZE, DETECTION_TILE_OVERLAP
+            )
+            self.detection_queue.add_tiled_task(task, tiles)
+        else:
+            # The region is read by the detection worker
+            task = DetectionTask(
+                image=None,
+                original_image_id=self.image_id,
+                image_part_position=(x, y),
+                label_name=self.label_name,
+                params={"all_parts": DETECTION_ALL_PARTS},
+                confidence_threshold=0.1,
+                path=self.image_path,
+                crop_rect=(x, y, width, height),
+            )
+            self.detection_queue.add_task(task)
         self.parent.update_queue_count()
 
-    def crop_image(self, x, y, width, height):
+    def image_source(self, path):
         """
-        Crop the selected area from the image using OpenCV.
+        Decoded image of a path if it is in memory, used by the detection
+        workers to read regions without decoding the file again.
         """
-        image = self.image_loader.image
-        cropped_image = image.crop((x, y, x + width, y + height))
-        cropped_image = cv2.cvtColor(np.array(cropped_image), cv2.COLOR_RGB2BGR)
-        return cropped_image, (x, y)
+        # Called from other threads, loaded_source is read once
+        loaded_source = self.loaded_source
+        if loaded_source is not None and loaded_source[0] == path:
+            return loaded_source[1]
+        return self.image_cache.get(path)
 
     def keyPressEvent(self, event):
         if event.key() == Qt.Key_Delete:
-            self.delete_rectangles(self.scene().selectedItems())
+            self.delete_rectangles(list(self.selected_labels))
 
         elif event.key() == Qt.Key_Space:
             self.setDragMode(QGraphicsView.ScrollHandDrag)
@@ -590,39 +727,138 @@ class ImageView(QGraphicsView):
         Label name is generated by adding number to the end of label_str
         :param label_str: label name
         """
-        label_names = [item.label_name for item in self.current_labels]
-        i = 0
-        while True:
-            label_name = f"{label_str} {i}"
-            if label_name not in label_names:
-                return label_name
+        i = self.label_name_counters.get(label_str, 0)
+        while f"{label_str} {i}" in self.labels_by_name:
             i += 1
+        self.label_name_counters[label_str] = i + 1
+        return f"{label_str} {i}"
 
     def delete_rectangles(self, labels):
         """
         Delete selected rectangles
         :param labels: list of labels
         """
+        labels = set(labels)
+        self.set_selection(self.selected_labels - labels)
+        self.current_labels = [
+            item for item in self.current_labels if item not in labels
+        ]
         for item in labels:
-            self.scene().removeItem(item)
-            self.current_labels.remove(item)
+            if self.labels_by_name.get(item.label_name) is item:
+                del self.labels_by_name[item.label_name]
+            self.label_index.discard(item)
+            self.label_layer.label_removed(item)
 
+        self.label_layer.update()
         self.labels_updated.emit()
 
     def select_labels(self, labels):
         if self.parent.updating_selection:
             return
-        for item in self.current_labels:
-            if item.label_name in labels:
-                item.setSelected(True)
-            else:
-                item.setSelected(False)
+        self.set_selection(
+            {
+                self.labels_by_name[name]
+                for name in labels
+                if name in self.labels_by_name
+            }
+        )
 
     def zoom_to_rect(self, label):
-        for rectangle in self.current_labels:
-            if rectangle.label_name == label:
-                self.fitInView(rectangle, Qt.KeepAspectRatio)
-                break
+        item = self.labels_by_name.get(label)
+        if item is not None:
+            self.fitInView(item.sceneBoundingRect(), Qt.KeepAspectRatio)
+
+    def label_at(self, point):
+        """
+        Find the topmost label containing a point
+        :param point: point in scene coordinates
+        :return: label item or None
+        """
+        for item in self.label_index.at(point.x(), point.y()):
+            if isinstance(item, RectangleItem):
+                if item.rect().contains(point):
+                    return item
+            elif item.polygon().containsPoint(point, Qt.OddEvenFill):
+                return item
+        return None
+
+    def labels_in_rect(self, rect):
+        """
+        Find labels whose shape intersects a rectangle
+        :param rect: QRectF in scene coordinates
+        :return: list of label items
+        """
+        rect_polygon = QPolygonF(rect)
+        labels = []
+        box = rect.left(), rect.top(), rect.right(), rect.bottom()
+        for item in self.label_index.intersecting(box):
+            if isinstance(item, RectangleItem) or rect_polygon.intersects(
+                item.polygon()
+            ):
+                labels.append(item)
+        return labels
+
+    def set_selection(self, labels):
+        """
+        Select exactly the given labels. Selected labels are added to the scene
+        with their resize handles, the others are only painted by label_layer.
+        :param labels: set of label items
+        """
+        labels = set(labels)
+        self.changing_selection = True
+        for item in self.selected_labels - labels:
+            self.deselect_label(item)
+        for item in labels - self.selected_labels:
+            self.select_label(item)
+        self.selected_labels = labels
+        self.changing_selection = False
+
+        if self.label_layer is not None:
+            self.label_layer.update()
+        self.selection_changed.emit()
+
+    def clear_selection(self):
+        if self.selected_labels:
+            self.set_selection(set())
+
+    def select_label(self, item):
+        item.setZValue(SELECTED_Z_VALUE)
+        self.scene().addItem(item)
+        item.add_resize_handles()
+        editable = self.current_mode == "select"
+        item.setFlag(QGraphicsRectItem.ItemIsMovable, editable)
+        item.setFlag(QGraphicsRectItem.ItemIsSelectable, True)
+        for handler in item.resize_handles:
+            handler.setFlag(QGraphicsRectItem.ItemIsMovable, editable)
+        item.setSelected(True)
+
+    def deselect_label(self, item):
+        item.remove_resize_handles()
+        if item.scene() is not None:
+            item.setSelected(False)
+            self.scene().removeItem(item)
+
+    def scene_selection_changed(self):
+        """
+        Qt deselects scene items on clicks and rubber band drags, drop those
+        labels from the selection too.
+        """
+        if self.changing_selection:
+            return
+        still_selected = {item for item in self.selected_labels if item.isSelected()}
+        if still_selected != self.selected_labels:
+            self.set_selection(still_selected)
+
+    def rubber_band_changed(self, rubber_band_rect, from_scene_point, to_scene_point):
+        """
+        Select the labels under the rubber band when the drag ends.
+        """
+        if not rubber_band_rect.isNull():
+            # to_scene_point lags one mouse move behind, map the rect instead
+            self.rubber_band_rect = self.mapToScene(rubber_band_rect).boundingRect()
+        elif self.rubber_band_rect is not None:
+            self.set_selection(self.labels_in_rect(self.rubber_band_rect))
+            self.rubber_band_rect = None
 
     def resizeEvent(self, event):
         super().resizeEvent(event)
@@ -632,7 +868,7 @@ class ImageView(QGraphicsView):
         """
         Disable movable flag for all rectangles
         """
-        for item in self.current_labels:
+        for item in self.selected_labels:
             item.setFlag(QGraphicsRectItem.ItemIsMovable, False)
             item.setFlag(QGraphicsRectItem.ItemIsSelectable, False)
 
@@ -640,17 +876,17 @@ class ImageView(QGraphicsView):
         """
         Enable movable flag for all items
         """
-        for item in self.current_labels:
+        for item in self.selected_labels:
             item.setFlag(QGraphicsRectItem.ItemIsMovable, True)
             item.setFlag(QGraphicsRectItem.ItemIsSelectable, True)
 
     def resize_disable(self):
-        for item in self.current_labels:
+        for item in self.selected_labels:
             for handler in item.resize_handles:
                 handler.setFlag(QGraphicsRectItem.ItemIsMovable, False)
 
     def resize_enable(self):
         if self.current_mode == "select":
-            for item in self.current_labels:
+            for item in self.selected_labels:
                 for handler in item.resize_handles:
                     handler.setFlag(QGraphicsRectItem.ItemIsMovable, True)
@@ -0,0 +1,93 @@
+from PySide6.QtCore import QRectF
+from PySide6.QtGui import QPen, QBrush, QColor, QPolygonF
+from PySide6.QtWidgets import QGraphicsItem, QStyleOptionGraphicsItem
+
+from src.utils.constants import LOD_TOLERANCE
+from src.widgets.labels.rectangle_item import RectangleItem
+
+# Stacking order of the layer and of the selected label items above it
+LAYER_Z_VALUE = 1
+SELECTED_Z_VALUE = 2
+
+
+class LabelLayer(QGraphicsItem):
+    """
+    Paints all labels of the image that are not selected.
+
+    Unselected labels are not added to the scene, so there is one scene item
+    no matter how many labels the image has. Selected labels are added to the
+    scene as normal items with their resize handles, see ImageView.set_selection.
+    """
+
+    def __init__(self, view):
+        super().__init__()
+        self.view = view
+        self.hovered_label = None
+        self.setZValue(LAYER_Z_VALUE)
+        self.setAcceptHoverEvents(True)
+        # Needed for exposedRect, which is used to skip labels out of view
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption, True)
+
+        self.pen = QPen(QColor(255, 0, 0))
+        self.pen.setWidth(0)
+        self.brush = QBrush(QColor(255, 0, 0, 32))
+        self.hover_brush = QBrush(QColor(255, 0, 0, 64))
+
+    def boundingRect(self):
+        return QRectF(0, 0, self.view.image_width, self.view.image_height)
+
+    def paint(self, painter, option, widget=None):
+        exposed = option.exposedRect
+        # Image pixels per screen pixel decide how much polygons are simplified
+        tolerance = LOD_TOLERANCE / QStyleOptionGraphicsItem.levelOfDetailFromTransform(
+            painter.worldTransform()
+        )
+        selected = self.view.selected_labels
+        rectangles = []
+        polygons = []
+        visible = self.view.label_index.intersecting(
+            (exposed.left(), exposed.top(), exposed.right(), exposed.bottom())
+        )
+        for label in visible:
+            if label in selected:
+                continue
+            if isinstance(label, RectangleItem):
+                rectangles.append(label.rect())
+            else:
+                polygons.append(label.lod_polygon(tolerance))
+
+        painter.setPen(self.pen)
+        painter.setBrush(self.brush)
+        if rectangles:
+            painter.drawRects(rectangles)
+        for polygon in polygons:
+            painter.drawPolygon(polygon)
+
+        if self.hovered_label is not None and self.hovered_label not in selected:
+            painter.setBrush(self.hover_brush)
+            painter.drawPolygon(self.label_polygon(self.hovered_label, tolerance))
+
+    @staticmethod
+    def label_polygon(label, tolerance=0):
+        if isinstance(label, RectangleItem):
+            return QPolygonF(label.rect())
+        return label.lod_polygon(tolerance)
+
+    def hoverMoveEvent(self, event):
+        label = self.view.label_at(event.pos())
+        if label is not self.hovered_label:
+            self.set_hovered_label(label)
+
+    def hoverLeaveEvent(self, event):
+        self.set_hovered_label(None)
+
+    def set_hovered_label(self, label):
+        for old_or_new in (self.hovered_label, label):
+            if old_or_new is not None:
+                rect = self.label_polygon(old_or_new).boundingRect()
+                self.update(rect.adjusted(-1, -1, 1, 1))
+        self.hovered_label = label
+
+    def label_removed(self, label):
+        if label is self.hovered_label:
+            self.hovered_label = None
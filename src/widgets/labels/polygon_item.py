@@ -1,8 +1,12 @@
+import math
+
+import numpy as np
 from PySide6.QtCore import Qt, QPointF, QRectF
 from PySide6.QtGui import QPen, QBrush, QColor, QPolygonF
-from PySide6.QtWidgets import QGraphicsPolygonItem, QGraphicsEllipseItem
+from PySide6.QtWidgets import QGraphicsPolygonItem, QGraphicsEllipseItem, QGraphicsItem
 
-from src.utils.functions import calculate_handle_size
+from src.utils.constants import HANDLE_SIZE, LOD_MIN_VERTICES
+from src.utils.simplification import simplify_polygon, vertex_importance
 from src.widgets.labels.rectangle_item import RectangleItem
 
 
@@ -14,8 +18,11 @@ class PolygonItem(QGraphicsPolygonItem):
         self.label_name_id = label_name_id
         self.hovered = False
         self.resize_handles = []
-        self.min_handle_size = 2
-        self.max_handle_size = 5
+        # Vertices, their ranks and simplified polygons by level, see
+        # lod_polygon
+        self.lod_points = None
+        self.lod_ranks = None
+        self.lod_polygons = {}
 
         self.default_pen = QPen(QColor(255, 0, 0))
         self.default_pen.setWidth(0.1)
@@ -23,8 +30,6 @@ class PolygonItem(QGraphicsPolygonItem):
         self.set_default_color()
         self.setAcceptHoverEvents(True)
 
-        self.add_resize_handles()
-
     def set_default_color(self):
         self.setPen(self.default_pen)
         self.setBrush(self.default_brush)
@@ -42,19 +47,37 @@ class PolygonItem(QGraphicsPolygonItem):
             "iscrowd": 0,
         }
 
-    def update_handle_scale(self, scale_factor):
+    def setPolygon(self, polygon):
+        super().setPolygon(polygon)
+        self.lod_points = None
+        self.lod_ranks = None
+        self.lod_polygons = {}
+
+    def lod_polygon(self, tolerance):
         """
-        Adjust the size of the resize handles based on the scale factor.
+        Simplified polygon for drawing with the given tolerance.
+
+        The tolerance is rounded down to a power of two, so a polygon has a
+        few cached levels of detail instead of one per zoom step.
+
+        :param tolerance: Distance in image pixels below which vertices can be
+            left out.
         """
-        handle_size = calculate_handle_size(
-            self.parent.image_width,
-            self.parent.image_height,
-            scale_factor,
-            self.min_handle_size,
-            self.max_handle_size,
-        )
-        for handle in self.resize_handles:
-            handle.set_size(handle_size)
+        polygon = self.polygon()
+        if polygon.count() < LOD_MIN_VERTICES or tolerance < 1:
+            return polygon
+
+        level = int(math.log2(tolerance))
+        simplified = self.lod_polygons.get(level)
+        if simplified is None:
+            if self.lod_ranks is None:
+                self.lod_points = np.array([point.toTuple() for point in polygon])
+                # Below a tolerance of 1 the full polygon is drawn
+                self.lod_ranks = vertex_importance(self.lod_points, min_rank=1)
+            kept = simplify_polygon(self.lod_points, self.lod_ranks, 2**level)
+            simplified = QPolygonF([QPointF(x, y) for x, y in kept.tolist()])
+            self.lod_polygons[level] = simplified
+        return simplified
 
     def get_bounding_box(self):
         return self.polygon().boundingRect()
@@ -100,10 +123,30 @@ class PolygonItem(QGraphicsPolygonItem):
 
     def add_resize_handles(self):
         for i, point in enumerate(self.polygon()):
-            handle = PolygonHandleItem(-2.5, -2.5, 5, 5, self, i)
+            handle = PolygonHandleItem(
+                -HANDLE_SIZE / 2, -HANDLE_SIZE / 2, HANDLE_SIZE, HANDLE_SIZE, self, i
+            )
             handle.setPos(point)
             self.resize_handles.append(handle)
 
+    def remove_resize_handles(self):
+        for handle in self.resize_handles:
+            if handle.scene() is not None:
+                handle.scene().removeItem(handle)
+            handle.setParentItem(None)
+        self.resize_handles = []
+
+    def mouseMoveEvent(self, event):
+        super().mouseMoveEvent(event)
+
+        # Keep the position in the polygon points, like RectangleItem does
+        delta = event.scenePos() - event.lastScenePos()
+        self.setPolygon(self.polygon().translated(delta))
+        self.setPos(0, 0)
+        for handle, point in zip(self.resize_handles, self.polygon()):
+            handle.setPos(point)
+        self.parent.update_labels()
+
     def move_vertex(self, index, new_pos):
         old_polygon = self.polygon()
         points = [old_polygon[i] for i in range(old_polygon.count())]
@@ -112,6 +155,9 @@ class PolygonItem(QGraphicsPolygonItem):
 
         new_polygon = QPolygonF(points)
         self.setPolygon(new_polygon)
+        # Moving a vertex inside the box doesn't change it, so the box check
+        # on mouse release alone would miss the edit
+        self.parent.update_labels()
 
 
 class PolygonHandleItem(QGraphicsEllipseItem):
@@ -125,10 +171,13 @@ class PolygonHandleItem(QGraphicsEllipseItem):
         pen.setStyle(Qt.SolidLine)
 
         self.setPen(pen)
+        # The handle is drawn in screen pixels, so zooming doesn't resize it
+        self.setFlag(QGraphicsItem.ItemIgnoresTransformations, True)
 
     def mouseMoveEvent(self, event):
-        QGraphicsEllipseItem.mouseMoveEvent(self, event)
-        new_pos = self.constrain_position(self.pos())
+        # Not the base implementation, it would move the selected polygon
+        # along with the handle
+        new_pos = self.constrain_position(self.parent.mapFromScene(event.scenePos()))
         self.setPos(new_pos)
         self.parent.move_vertex(self.index, new_pos)
 
@@ -140,9 +189,3 @@ class PolygonHandleItem(QGraphicsEllipseItem):
         x = min(max(pos.x(), image_rect.left()), image_rect.right())
         y = min(max(pos.y(), image_rect.top()), image_rect.bottom())
         return QPointF(x, y)
-
-    def set_size(self, size):
-        """
-        Set the size of the handle.
-        """
-        self.setRect(-size / 2, -size / 2, size, size)
@@ -4,7 +4,7 @@ from PySide6.QtCore import Qt, QPointF, QRectF, Signal, QObject
 from PySide6.QtWidgets import QGraphicsRectItem, QGraphicsEllipseItem, QGraphicsItem
 from PySide6.QtGui import QPen, QBrush, QColor
 
-from src.utils.functions import calculate_handle_size
+from src.utils.constants import HANDLE_SIZE
 
 
 class RectangleItem(QGraphicsRectItem):
@@ -38,12 +38,8 @@ class RectangleItem(QGraphicsRectItem):
         self.label_name = label_name
         self.label_name_id = label_name_id
 
-        self.min_handle_size = 2
-        self.max_handle_size = 5
-
         self.set_default_color()
         if not self.temporary:
-            self.add_resize_handles()
             self.setAcceptHoverEvents(True)
 
     def to_dict(self):
@@ -75,20 +71,6 @@ class RectangleItem(QGraphicsRectItem):
             QPointF(min(x1, x2), min(y1, y2)), QPointF(max(x1, x2), max(y1, y2))
         )
 
-    def update_handle_scale(self, scale_factor):
-        """
-        Adjust the size of the resize handles based on the scale factor.
-        """
-        handle_size = calculate_handle_size(
-            self.parent.image_width,
-            self.parent.image_height,
-            scale_factor,
-            self.min_handle_size,
-            self.max_handle_size,
-        )
-        for handle in self.resize_handles:
-            handle.set_size(handle_size)
-
     def set_default_color(self):
         self.setPen(self.default_pen)
         self.setBrush(self.default_brush)
@@ -147,12 +129,11 @@ class RectangleItem(QGraphicsRectItem):
     #     self.parent.set_mode(self.parent.current_mode)
 
     def add_resize_handles(self):
-        handle_size = 5
-        half_size = handle_size / 2
+        half_size = HANDLE_SIZE / 2
 
         for x, y in [(0, 0), (1, 0), (0, 1), (1, 1)]:
             handle = RectangleHandleItem(
-                -half_size, -half_size, handle_size, handle_size, self
+                -half_size, -half_size, HANDLE_SIZE, HANDLE_SIZE, self
             )
             handle.setPos(
                 self.rect().x() + x * self.rect().width(),
@@ -163,6 +144,13 @@ class RectangleItem(QGraphicsRectItem):
 
             self.resize_handles.append(handle)
 
+    def remove_resize_handles(self):
+        for handle in self.resize_handles:
+            if handle.scene() is not None:
+                handle.scene().removeItem(handle)
+            handle.setParentItem(None)
+        self.resize_handles = []
+
     def update_handlers(self):
         for handle in self.resize_handles:
             x_offset, y_offset = handle.data(0)
@@ -182,6 +170,8 @@ class RectangleHandleItem(QGraphicsEllipseItem):
         pen.setStyle(Qt.SolidLine)
         self.setAcceptHoverEvents(True)
         self.setPen(pen)
+        # The handle is drawn in screen pixels, so zooming doesn't resize it
+        self.setFlag(QGraphicsItem.ItemIgnoresTransformations, True)
 
     # def mousePressEvent(self, event):
     #     self.parent.resize_started()
@@ -191,9 +181,10 @@ class RectangleHandleItem(QGraphicsEllipseItem):
         x_offset, y_offset = self.data(0)
         image_width = self.parent.parent.image_width
         image_height = self.parent.parent.image_height
+        # Item coordinates of the handle are screen pixels, use the scene
         x, y = (
-            event.pos().x() - event.lastPos().x(),
-            event.pos().y() - event.lastPos().y(),
+            event.scenePos().x() - event.lastScenePos().x(),
+            event.scenePos().y() - event.lastScenePos().y(),
         )
 
         if x_offset == 0:
@@ -224,14 +215,10 @@ class RectangleHandleItem(QGraphicsEllipseItem):
         )
         # new_rect = QRectF(new_x, new_y, new_width, new_height)
         # self.parent.setRect(new_rect)
-        QGraphicsEllipseItem.mouseMoveEvent(self, event)
+        # Not calling QGraphicsEllipseItem.mouseMoveEvent, it would move the
+        # selected rectangle along with the handle
         self.parent.update_handlers()
 
-    def set_size(self, size):
-        """
-        Set the size of the handle.
-        """
-        self.setRect(-size / 2, -size / 2, size, size)
 
     # def mouseReleaseEvent(self, event):
     #     self.parent.resize_stopped()
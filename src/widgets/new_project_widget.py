@@ -13,6 +13,8 @@ from PySide6.QtWidgets import (
     QFileDialog,
     QAbstractItemView,
     QDialog,
+    QCheckBox,
+    QProgressDialog,
 )
 
 from src.models.anno_project import AnnoProject
@@ -71,6 +73,12 @@ class NewProjectWidget(QWidget):
         self.images_layout.addWidget(self.images_list_label)
         self.images_layout.addWidget(self.images_list)
         self.images_layout.addLayout(self.images_buttons_layout)
+        self.lazy_sizes_checkbox = QCheckBox("Read image sizes when opened")
+        self.lazy_sizes_checkbox.setToolTip(
+            "Create the project without reading every image now. "
+            "Faster for large image sets."
+        )
+        self.images_layout.addWidget(self.lazy_sizes_checkbox)
 
         # Class List and Buttons
         self.classes_layout = QVBoxLayout()
@@ -123,7 +131,7 @@ class NewProjectWidget(QWidget):
         image_files, _ = file_dialog.getOpenFileNames(
             self,
             caption="Select images",
-            filter="Images (*.png *.jpg *.jpeg *.tif *.tiff)",
+            filter="Images (*.png *.jpg *.jpeg *.tif *.tiff *.npy)",
         )
         if image_files:
             for image in image_files:
@@ -168,11 +176,28 @@ class NewProjectWidget(QWidget):
             self.classes_list.item(i).text() for i in range(self.classes_list.count())
         ]
 
+        lazy = self.lazy_sizes_checkbox.isChecked()
+        progress_dialog = None
+        if not lazy:
+            progress_dialog = QProgressDialog(
+                "Reading images...", None, 0, len(images_paths), self
+            )
+            progress_dialog.setWindowTitle("Creating project")
+            progress_dialog.setWindowModality(Qt.WindowModal)
+            progress_dialog.setMinimumDuration(500)
+
+        def update_progress(done, total):
+            progress_dialog.setValue(done)
+
         project = AnnoProject.create(
             main_window=self.parent,
             name=project_name,
             images=images_paths,
             class_names=class_names,
             last_opened="",
+            lazy=lazy,
+            progress_callback=update_progress if progress_dialog else None,
         )
+        if progress_dialog is not None:
+            progress_dialog.close()
         self.project_created.emit(project)
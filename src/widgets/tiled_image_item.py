@@ -0,0 +1,57 @@
+import math
+
+from PySide6.QtCore import QRectF
+from PySide6.QtWidgets import QGraphicsItem, QStyleOptionGraphicsItem
+
+from src.models.image_pyramid import ImagePyramid
+
+
+class TiledImageItem(QGraphicsItem):
+    """
+    Displays an ImagePyramid. Only the tiles that intersect the exposed area
+    are painted, taken from the pyramid level that matches the current zoom.
+    """
+
+    def __init__(self, pyramid: ImagePyramid):
+        super().__init__()
+        self.pyramid = pyramid
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption, True)
+
+    def boundingRect(self):
+        return QRectF(0, 0, self.pyramid.width, self.pyramid.height)
+
+    def paint(self, painter, option, widget=None):
+        scale = QStyleOptionGraphicsItem.levelOfDetailFromTransform(
+            painter.worldTransform()
+        )
+        level = self.pyramid.level_for_scale(scale)
+        level_height, level_width = self.pyramid.levels[level].shape[:2]
+        # Level sizes are rounded down, so use the exact ratio to level 0
+        scale_x = self.pyramid.width / level_width
+        scale_y = self.pyramid.height / level_height
+        tile_size = self.pyramid.tile_size
+
+        exposed = option.exposedRect.intersected(self.boundingRect())
+        if exposed.isEmpty():
+            return
+
+        columns, rows = self.pyramid.tile_grid(level)
+        first_col = max(0, int(exposed.left() / scale_x) // tile_size)
+        first_row = max(0, int(exposed.top() / scale_y) // tile_size)
+        last_col = min(
+            columns - 1, int(math.ceil(exposed.right() / scale_x)) // tile_size
+        )
+        last_row = min(
+            rows - 1, int(math.ceil(exposed.bottom() / scale_y)) // tile_size
+        )
+
+        for row in range(first_row, last_row + 1):
+            for col in range(first_col, last_col + 1):
+                pixmap = self.pyramid.tile_pixmap(level, col, row)
+                target = QRectF(
+                    col * tile_size * scale_x,
+                    row * tile_size * scale_y,
+                    pixmap.width() * scale_x,
+                    pixmap.height() * scale_y,
+                )
+                painter.drawPixmap(target, pixmap, QRectF(pixmap.rect()))